@@ -4,26 +4,45 @@
     Author: martian0x80
 """
 
-import argparse
+from __future__ import annotations
+
+import csv
+import glob
+import hashlib
 import json
+import logging
+import multiprocessing
+import os
 import re
-from itertools import groupby
-from abc import ABC, abstractmethod
+import struct
+import sys
+import threading
+import warnings
+from time import perf_counter
+from bisect import bisect_right
+from contextlib import nullcontext
+from operator import itemgetter
 from datetime import datetime
 from enum import StrEnum
-from multiprocessing import Manager, Pool
+from multiprocessing import Pool
+from multiprocessing.connection import wait
+from typing import TYPE_CHECKING
+
+# pdfplumber, pandas and rich are imported where they're used, so importing the
+# parser (and starting a worker process) stays cheap
+if TYPE_CHECKING:
+    from pdfplumber.page import Page
+    from pdfplumber.table import Table, TableSettings
 
-import pandas as pd
-import pdfplumber
-from pdfplumber.page import Page
-from rich import print as rprint
-from rich.console import Console
-from rich.progress import Progress
+__version__ = "0.1.0"
 
 PDF_PATH = "RESULT_BTECH7_DEC2023.pdf"
 RESULT_PATH = "result.txt"
 SCHEME_PATH = "scheme.txt"
 
+# Fraction of the page height (from the top) that holds the page headers
+HEADER_BAND = 0.2
+
 semHeaderMap = {
     "TENTH SEMESTER": 10,
     "NINTH SEMESTER": 9,
@@ -48,120 +67,691 @@ semHeaderMap = {
 }
 
 
-progress = Progress()
-console = Console()
-
-parser = argparse.ArgumentParser(
-    prog="IPU Results PDF Parser by martian0x80",
-    description="Parses the IPU results pdf to generate meaningful data for export and data pipelines\nAuthor: martian0x80",
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-)
-
-parser.add_argument(
-    "-os",
-    "--output-scheme",
-    action="store",
-    dest="output_scheme",
-    default=SCHEME_PATH,
-    help="Output the scheme data here (txt)",
-)
-
-parser.add_argument(
-    "-or",
-    "--output-result",
-    action="store",
-    dest="output_result",
-    default=RESULT_PATH,
-    help="Output the result data here (txt)",
-)
-
-parser.add_argument(
-    "-ps", "--print-scheme", action="store_true", dest="stdout_scheme", default=False
-)
-parser.add_argument(
-    "-pr", "--print-result", action="store_true", dest="stdout_result", default=False
-)
-
-parser.add_argument(
-    "-mp", "--multi-process", action="store_true", dest="multi_process", default=False
-)
-
-parser.add_argument(
-    "-sp", "--single-process", action="store_true", dest="single_process", default=False
-)
-
-parser.add_argument(
-    "-in",
-    "--input",
-    action="store",
-    dest="input",
-    help="Path to the pdf file",
-    default=PDF_PATH,
-)
+log = logging.getLogger("ParserSenpai")
+
+
+def open_pdf(pdf_path: str):
+    import pdfplumber
+
+    return pdfplumber.open(pdf_path)
+
+
+def echo(*objects, **kwargs):
+    # Console output of the stdout_scheme / stdout_result options
+    from rich import print as rprint
+
+    rprint(*objects, **kwargs)
 
 
 def n_clusters(iterable, n=2):
     return list(map(list, zip(*[iter(iterable)] * n)))
 
 
-""" Later
-class IPageType(ABC):
-    @abstractmethod
-    def __init__():
+class Metrics:
+    """
+    Per-stage timers and counters of a parse (--profile)
+    Stage times are exclusive, time spent in a nested stage (e.g. chars parsed while
+    classifying) is only counted for the inner stage, so the stages add up to the
+    parse time. Pages are also recorded one by one with their own stage times.
+    Gauges keep the largest value they were set to (e.g. peak worker RSS).
+    Workers send their metrics back as to_dict() and the parent merge()s them
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.gauges = {}
+        self.pages = []
+        self._page = {}
+        self._stack = []
+
+    def time(self, stage: str):
+        return _StageTimer(self, stage)
+
+    def _enter(self, stage: str):
+        self._stack.append([stage, perf_counter(), 0.0])
+
+    def _exit(self):
+        stage, start, nested = self._stack.pop()
+        elapsed = perf_counter() - start
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        own = elapsed - nested
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + own
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        self._page[stage] = self._page.get(stage, 0.0) + own
+
+    def count(self, name: str, n: int = 1):
+        if n:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float):
+        self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def end_page(self, page_number: int, ptype):
+        self.count(f"pages{str(ptype).capitalize()}")
+        self.pages.append(
+            {"page": page_number, "type": str(ptype), "stages": self._page}
+        )
+        self._page = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "calls": self.calls,
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "pages": self.pages,
+        }
+
+    def merge(self, other: dict):
+        for stage, seconds in other["seconds"].items():
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        for stage, calls in other["calls"].items():
+            self.calls[stage] = self.calls.get(stage, 0) + calls
+        for name, n in other["counters"].items():
+            self.count(name, n)
+        for name, value in other["gauges"].items():
+            self.gauge(name, value)
+        self.pages.extend(other["pages"])
+
+    def summary(self, wall_seconds: float = None) -> dict:
+        total = sum(self.seconds.values())
+        return {
+            "wallSeconds": wall_seconds,
+            "stageSeconds": total,
+            "stages": {
+                stage: {
+                    "seconds": seconds,
+                    "calls": self.calls[stage],
+                    "share": seconds / total if total else 0.0,
+                }
+                for stage, seconds in sorted(
+                    self.seconds.items(), key=itemgetter(1), reverse=True
+                )
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(self.gauges.items())),
+            "pages": sorted(self.pages, key=itemgetter("page")),
+        }
+
+    def write_summary(self, path: str, wall_seconds: float = None):
+        with open(path, "w") as f:
+            json.dump(self.summary(wall_seconds), f, indent=4)
+
+    def write_prometheus(self, path: str):
+        # Textfile collector format, written to a temporary file and renamed into place
+        def snake(name):
+            return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+        lines = [
+            "# HELP parsersenpai_stage_seconds_total Time spent in a parse stage",
+            "# TYPE parsersenpai_stage_seconds_total counter",
+            *(
+                f'parsersenpai_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                for stage, seconds in sorted(self.seconds.items())
+            ),
+            "# HELP parsersenpai_stage_calls_total Times a parse stage ran",
+            "# TYPE parsersenpai_stage_calls_total counter",
+            *(
+                f'parsersenpai_stage_calls_total{{stage="{stage}"}} {calls}'
+                for stage, calls in sorted(self.calls.items())
+            ),
+        ]
+        for name, n in sorted(self.counters.items()):
+            metric = f"parsersenpai_{snake(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {n}"]
+        for name, value in sorted(self.gauges.items()):
+            metric = f"parsersenpai_{snake(name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage")
+
+    def __init__(self, metrics: Metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.metrics._enter(self.stage)
+
+    def __exit__(self, *exc):
+        self.metrics._exit()
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics when profiling is off, every call is a no-op on a shared, stateless instance
+    """
+
+    enabled = False
+
+    def __init__(self):
+        super().__init__()
+        self._timer = nullcontext()
+
+    def time(self, stage: str):
+        return self._timer
+
+    def count(self, name: str, n: int = 1):
         pass
-    
-    @abstractmethod
-    def get_header(self):
+
+    def gauge(self, name: str, value: float):
         pass
-    
+
+    def end_page(self, page_number: int, ptype):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class TableTemplate:
+    """
+    Ruling grid of a table learned from one page
+    Rows are stored as patterns of (x0, x1, rowspan) cells, the first `head` rows
+    are kept as they are and the remaining rows repeat every `period` rows,
+    only the row boundaries (y) are re-read from each page
     """
 
-cache = {}
+    # Longest repeating row group (a student takes 3 rows) and header rows tried
+    MAX_PERIOD = 4
+    MAX_HEAD = 3
 
+    def __init__(self, rows, head, period):
+        self.rows = rows
+        self.head = head
+        self.period = period
 
-class PTScheme:
-    def __init__(self, schemePage: Page):
-        self.schemePage = schemePage
-        self.schemeText = schemePage.extract_text_simple()
+    @classmethod
+    def learn(cls, table: Table):
+        ys = sorted(
+            {round(cell[1], 1) for cell in table.cells}
+            | {round(cell[3], 1) for cell in table.cells}
+        )
+        index = {y: i for i, y in enumerate(ys)}
+        rows = [[] for _ in ys[:-1]]
+        for x0, top, x1, bottom in sorted(table.cells, key=lambda cell: cell[0]):
+            i = index[round(top, 1)]
+            rows[i].append((round(x0, 1), round(x1, 1), index[round(bottom, 1)] - i))
+        rows = [tuple(row) for row in rows]
+
+        for period in range(1, cls.MAX_PERIOD + 1):
+            for head in range(0, cls.MAX_HEAD + 1):
+                # Need at least two repeats to trust the period
+                if len(rows) - head < 2 * period:
+                    continue
+                if all(
+                    rows[i] == rows[i - period] for i in range(head + period, len(rows))
+                ):
+                    return cls(rows[: head + period], head, period)
+        return None
+
+    def row_patterns(self, n):
+        if n < self.head or (n - self.head) % self.period:
+            return None
+        patterns = [
+            self.rows[i if i < self.head else self.head + (i - self.head) % self.period]
+            for i in range(n)
+        ]
+        if any(i + span > n for i, row in enumerate(patterns) for _, _, span in row):
+            return None
+        return patterns
+
+    def extract(self, chars, ys, text_settings):
+        """
+        Fill the grid laid over the row boundaries `ys` with `chars`
+        Produces the same rows as pdfplumber's Table.extract would for these cells,
+        but buckets each char once instead of scanning every char for every row
+        """
+        from pdfplumber.utils import extract_text
+
+        patterns = self.row_patterns(len(ys) - 1)
+        if patterns is None:
+            return None
+
+        # Bucket chars by row band on their vertical midpoint, keeping page order
+        bands = [[] for _ in patterns]
+        for i, char in enumerate(chars):
+            band = bisect_right(ys, (char["top"] + char["bottom"]) / 2) - 1
+            if 0 <= band < len(bands):
+                bands[band].append((i, char))
+
+        xs = sorted({x0 for row in patterns for x0, _, _ in row})
+        table = []
+        for i, row in enumerate(patterns):
+            cells = dict.fromkeys(xs)
+            for x0, x1, span in row:
+                candidates = bands[i]
+                if span > 1:
+                    candidates = sorted(
+                        (item for band in bands[i : i + span] for item in band),
+                        key=itemgetter(0),
+                    )
+                cell_chars = [
+                    char
+                    for _, char in candidates
+                    if x0 <= (char["x0"] + char["x1"]) / 2 < x1
+                ]
+                cells[x0] = (
+                    extract_text(cell_chars, **text_settings) if cell_chars else ""
+                )
+            table.append(list(cells.values()))
+        return table
+
+
+class SchemeFingerprints:
+    """
+    Parsed scheme subjects keyed by schemeID and a hash of the table-region text
+    The same scheme page is printed again for every institute that runs the
+    programme, only the institute line of the header changes. A repeat is
+    recognized from its text and gets the subjects of the first copy, without
+    extracting its table. Holds at most max_entries schemes, oldest first out
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.entries = {}
+        self.max_entries = max_entries
+        self.hits = 0
+
+    @staticmethod
+    def key(scheme_id: str, table_text: str):
+        return scheme_id, hashlib.blake2b(table_text.encode(), digest_size=16).digest()
 
-        r""" Older version (Works on newer scheme headers)
-            SCHEME\sOF\sEXAMINATIONS\n
-            Prg\.\sCode:\s+(?P<prgCode>\d+)\s+
-            Programme:\s+(?P<programme>.*?)\s+
-            SchemeID:\s+(?P<schemeID>\d+)\s+
-            Sem\.\/Annual:\s+(?P<sem>.*?)\s+
-            Institution\sCode:\s+(?P<instCode>\d+)\s+
-            Institution:\s+(?P<instName>.*?)\n
+    def get(self, key):
+        subjects = self.entries.get(key)
+        if subjects is not None:
+            self.hits += 1
+        return subjects
+
+    def put(self, key, subjects: dict):
+        if len(self.entries) >= self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        self.entries[key] = subjects
+
+
+class TableTemplates:
+    """
+    Layout-template table engine
+    pdfplumber's table finder is the dominant per-page cost, yet within a PDF
+    almost every page of a layout has the same column positions.
+    The grid is learned with the finder on the first page of a layout,
+    later pages of the same layout only have their row rulings read and
+    their chars bucketed into the cached cells.
+    A page that fails validation re-learns the grid with the finder.
+    Repeated scheme pages skip the table altogether, see SchemeFingerprints
+
+    Layouts are keyed by the page size and the x positions of the vertical rulings
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.fingerprints = SchemeFingerprints()
+        self.learned = 0
+        self.reused = 0
+        # Pages whose layout had a grid that didn't fit them
+        self.fallbacks = 0
+
+    @staticmethod
+    def _snap(values, tolerance):
+        from pdfplumber.utils import cluster_list
+
+        return [sum(group) / len(group) for group in cluster_list(values, tolerance)]
+
+    def _layout_key(self, page: Page, tset: TableSettings, settings_key):
+        xs = self._snap(
+            [
+                edge["x0"]
+                for edge in page.vertical_edges
+                if edge["height"] >= tset.edge_min_length
+            ],
+            tset.snap_x_tolerance,
+        )
+        return (
+            settings_key,
+            round(page.width),
+            round(page.height),
+            tuple(round(x) for x in xs),
+        )
+
+    def _row_rulings(self, page: Page, tset: TableSettings, template: TableTemplate):
+        # Horizontal rulings that lie within the template's table
+        left = min(x0 for row in template.rows for x0, _, _ in row)
+        right = max(x1 for row in template.rows for _, x1, _ in row)
+        tolerance = tset.snap_x_tolerance
+        return self._snap(
+            [
+                edge["top"]
+                for edge in page.horizontal_edges
+                if edge["width"] >= tset.edge_min_length
+                and edge["x0"] >= left - tolerance
+                and edge["x1"] <= right + tolerance
+            ],
+            tset.snap_y_tolerance,
+        )
+
+    def extract_table(self, page: Page, table_settings: dict = None, validate=None):
+        from pdfplumber.table import TableSettings
+
+        tset = TableSettings.resolve(table_settings)
+        settings_key = (
+            None if table_settings is None else repr(sorted(table_settings.items()))
+        )
+        key = self._layout_key(page, tset, settings_key)
+
+        template = self.templates.get(key)
+        if template is not None:
+            table = template.extract(
+                page.chars, self._row_rulings(page, tset, template), tset.text_settings
+            )
+            if table is not None:
+                if validate is None or validate(table):
+                    self.reused += 1
+                    return table
+            self.fallbacks += 1
+
+        # New layout or the cached grid doesn't fit this page, (re-)learn it
+        found = page.find_table(tset)
+        if found is None:
+            return None
+        self.learned += 1
+        table = found.extract(**tset.text_settings)
+        if validate is None or validate(table):
+            learned = TableTemplate.learn(found)
+            if learned is not None:
+                self.templates[key] = learned
+        return table
+
+
+class PdfiumText:
+    """
+    Text backend on pypdfium2's native text extraction (--text-backend pdfium)
+    Page classification and the header regexes read their text from here, so a page
+    only goes through pdfminer's layout analysis (page.chars) when its table is
+    extracted. pdfium's chars are laid out with pdfplumber's extract_text_simple,
+    the same as the chars of the default backend, so the text is the same.
+    pdfium keeps only the first of a run of space characters, the rest are put back
+    from the width of the gap after it
+    """
+
+    name = "pdfium"
+
+    def __init__(self, pdf_path: str):
+        import pypdfium2
+
+        self.document = pypdfium2.PdfDocument(pdf_path)
+
+    def chars(self, page_number: int, band: float = None):
+        # pdfplumber style chars of the page, of its top band only with band
+        import pypdfium2.raw as pdfium_c
+
+        page = self.document[page_number - 1]
+        textpage = page.get_textpage()
+        try:
+            left, bottom, right, top = page.get_bbox()
+            cutoff = top - (top - bottom) * band if band is not None else bottom
+            box = pdfium_c.FS_RECTF()
+            chars = []
+            for i in range(pdfium_c.FPDFText_CountChars(textpage)):
+                # Spaces pdfium made up for gaps, extract_text_simple adds its own
+                if pdfium_c.FPDFText_IsGenerated(textpage, i) == 1:
+                    continue
+                pdfium_c.FPDFText_GetLooseCharBox(textpage, i, box)
+                if box.top <= cutoff:
+                    continue
+                char = {
+                    "text": chr(pdfium_c.FPDFText_GetUnicode(textpage, i)),
+                    "x0": box.left,
+                    "x1": box.right,
+                    "top": top - box.top,
+                    "bottom": top - box.bottom,
+                    "upright": True,
+                }
+                char["doctop"] = char["top"]
+                if chars and chars[-1]["text"] == " ":
+                    space = chars[-1]
+                    width = space["x1"] - space["x0"]
+                    if width > 0 and abs(space["top"] - char["top"]) < 1:
+                        for _ in range(round((char["x0"] - space["x1"]) / width)):
+                            space = {
+                                **space,
+                                "x0": space["x1"],
+                                "x1": space["x1"] + width,
+                            }
+                            chars.append(space)
+                chars.append(char)
+            return chars
+        finally:
+            textpage.close()
+            page.close()
+
+    def text(self, page_number: int):
+        from pdfplumber.utils import extract_text_simple
+
+        return extract_text_simple(self.chars(page_number))
+
+    def header_text(self, page_number: int):
+        from pdfplumber.utils import extract_text_simple
+
+        return extract_text_simple(self.chars(page_number, HEADER_BAND))
+
+    def close(self):
+        self.document.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Text backends by name, pdfplumber is the default one built into PageContext
+TEXT_BACKENDS = {
+    "pdfplumber": None,
+    "pdfium": PdfiumText,
+}
+
+
+def open_text_backend(pdf_path: str, text_backend: str = "pdfplumber"):
+    # Text backend instance for the PDF, None for the default pdfplumber one
+    backend = TEXT_BACKENDS[text_backend]
+    return None if backend is None else backend(pdf_path)
+
+
+def open_text(pdf_path: str, text_backend: str = "pdfplumber"):
+    # Context manager form of open_text_backend, yields None for pdfplumber
+    return open_text_backend(pdf_path, text_backend) or nullcontext()
+
+
+class PageContext:
+    """
+    Per-page extraction context
+    Text, chars and tables are extracted lazily and at most once per page,
+    PageType, PTScheme and PTResult all read from the same context
+    instead of re-extracting the page on their own
+    The text comes from the page's chars, or from text_backend when there is one
+    (see PdfiumText), the tables always come from the chars
+    """
+
+    def __init__(
+        self,
+        page: Page,
+        tables: TableTemplates = None,
+        fallback_date=None,
+        metrics: Metrics = NULL_METRICS,
+        text_backend: PdfiumText = None,
+    ):
+        self.page = page
+        self.tables = tables
+        self.metrics = metrics
+        self.text_backend = text_backend
+        # Result date to use when the page's own one can't be parsed
+        self.fallback_date = fallback_date
+        self._chars = None
+        self._text = None
+        self._header_text = None
+        self._tables = {}
+        self._matches = {}
+
+    @classmethod
+    def of(cls, page):
+        # Accept either a bare pdfplumber page or an existing context
+        return page if isinstance(page, cls) else cls(page)
+
+    @property
+    def page_number(self):
+        return self.page.page_number
+
+    @property
+    def chars(self):
+        if self._chars is None:
+            with self.metrics.time("chars"):
+                self._chars = self.page.chars
+        return self._chars
+
+    @property
+    def text(self):
+        if self._text is None:
+            from pdfplumber.utils import extract_text_simple
+
+            if self.text_backend is not None:
+                with self.metrics.time("text"):
+                    self._text = self.text_backend.text(self.page_number)
+                return self._text
+            chars = self.chars
+            with self.metrics.time("text"):
+                self._text = extract_text_simple(chars)
+        return self._text
+
+    @property
+    def header_text(self):
         """
+        Text of the top band of the page only, enough for the page headers
+        On pdfplumber the band is cut from the page's chars, so the whole page's
+        layout is still analysed (and kept for the table extraction), the band only
+        saves laying out the text. The band is read alone with a text_backend
+        (-tb pdfium), that is the cheap path for pages that are only classified
+        """
+        if self._header_text is None:
+            from pdfplumber.utils import extract_text_simple
+
+            if self.text_backend is not None:
+                with self.metrics.time("headerText"):
+                    self._header_text = self.text_backend.header_text(self.page_number)
+                return self._header_text
+            chars = self.chars
+            with self.metrics.time("headerText"):
+                cutoff = self.page.bbox[1] + self.page.height * HEADER_BAND
+                self._header_text = extract_text_simple(
+                    [char for char in chars if char["top"] < cutoff]
+                )
+        return self._header_text
 
-        r""" Samples (extracted with extract_text_simple()):
-        
-        (SCHEME OF EXAMINATIONS)\nScheme of Programme Code: 027     Programme Name: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      SchemeID: 190272016001     Sem./Year: 06 SEMESTER\nInstitution Code: 115     Institution: BHARATI VIDYAPEETH COLLEGE OF ENGINEERING\n
+    def search(self, pattern: re.Pattern):
+        # Header regexes are run once per page, callers build their dicts from the match
+        if pattern not in self._matches:
+            self._matches[pattern] = pattern.search(self.text)
+        return self._matches[pattern]
 
-        SCHEME OF EXAMINATIONS\nPrg. Code: 027      Programme: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      SchemeID: 190272021001      Sem./Annual: THIRD SEMESTER\nInstitution Code: 115      Institution: BHARATI VIDYAPEETH COLLEGE OF ENGINEERING\n
+    def search_header(self, pattern: re.Pattern):
         """
+        Same as search, but tries the header band first
+        A band match is only trusted if at least one complete line follows it,
+        otherwise the band may have cut the header short and the full text is searched
+        """
+        key = (pattern, "header")
+        if key not in self._matches:
+            match = pattern.search(self.header_text)
+            if match is None or "\n" not in self.header_text[match.end() :]:
+                match = self.search(pattern)
+            self._matches[key] = match
+        return self._matches[key]
+
+    def extract_table(self, table_settings: dict = None, validate=None):
+        # validate(table) -> bool lets the template engine reject a cached grid
+        key = None if table_settings is None else repr(sorted(table_settings.items()))
+        if key not in self._tables:
+            with self.metrics.time("extractTable"):
+                if self.tables is not None:
+                    learned, fallbacks = self.tables.learned, self.tables.fallbacks
+                    self._tables[key] = self.tables.extract_table(
+                        self.page, table_settings, validate
+                    )
+                    self.metrics.count(
+                        "tableTemplatesLearned", self.tables.learned - learned
+                    )
+                    self.metrics.count(
+                        "tableFallbacks", self.tables.fallbacks - fallbacks
+                    )
+                else:
+                    self._tables[key] = self.page.extract_table(table_settings)
+        return self._tables[key]
+
+    def flush(self):
+        self._chars = None
+        self._text = None
+        self._header_text = None
+        self._tables.clear()
+        self._matches.clear()
+        # Fix for memory leak
+        self.page.flush_cache()
+
+
+class PTScheme:
+    r""" Older version (Works on newer scheme headers)
+        SCHEME\sOF\sEXAMINATIONS\n
+        Prg\.\sCode:\s+(?P<prgCode>\d+)\s+
+        Programme:\s+(?P<programme>.*?)\s+
+        SchemeID:\s+(?P<schemeID>\d+)\s+
+        Sem\.\/Annual:\s+(?P<sem>.*?)\s+
+        Institution\sCode:\s+(?P<instCode>\d+)\s+
+        Institution:\s+(?P<instName>.*?)\n
+    """
 
+    r""" Samples (extracted with extract_text_simple()):
+    
+    (SCHEME OF EXAMINATIONS)\nScheme of Programme Code: 027     Programme Name: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      SchemeID: 190272016001     Sem./Year: 06 SEMESTER\nInstitution Code: 115     Institution: BHARATI VIDYAPEETH COLLEGE OF ENGINEERING\n
+
+    SCHEME OF EXAMINATIONS\nPrg. Code: 027      Programme: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      SchemeID: 190272021001      Sem./Annual: THIRD SEMESTER\nInstitution Code: 115      Institution: BHARATI VIDYAPEETH COLLEGE OF ENGINEERING\n
+    """
+
+    r"""
+    How did I write this regex?
+    God knows. I don't remember. I just wrote it and it worked.
+    Also, \n is a literal n followed by a slash, not a newline.
+    Regexer with PCRE treats it as a newline (so use \\n there),
+    but python's raw strings treats it as a literal n followed by a slash,
+    which is what we want here.
+    """
+
+    pattern = re.compile(
         r"""
-        How did I write this regex?
-        God knows. I don't remember. I just wrote it and it worked.
-        Also, \n is a literal n followed by a slash, not a newline.
-        Regexer with PCRE treats it as a newline (so use \\n there),
-        but python's raw strings treats it as a literal n followed by a slash,
-        which is what we want here.
-        """
-
-        self.pattern = re.compile(
-            r"""
-            \(?SCHEME\sOF\sEXAMINATIONS\)?\n
-            (?:Scheme\sof\s)?(?:Prg|Programme)\.?\sCode:\s*(?P<prgCode>\d+)\s{2,}
-            Programme(?:\sName)?:\s*(?P<programme>.*?)\s{2,}
-            SchemeID:\s*(?P<schemeID>\d+)\s{2,}
-            Sem\.\/(?:Annual|Year):\s*(?P<sem>.*?)\n
-            Institution\sCode:\s*\'?(?P<instCode>\d+)\'?\s{2,}
-            Institution:\s*(?P<instName>.*?)\n
-        """,
-            re.VERBOSE,
-        )
+        \(?SCHEME\sOF\sEXAMINATIONS\)?\n
+        (?:Scheme\sof\s)?(?:Prg|Programme)\.?\sCode:\s*(?P<prgCode>\d+)\s{2,}
+        Programme(?:\sName)?:\s*(?P<programme>.*?)\s{2,}
+        SchemeID:\s*(?P<schemeID>\d+)\s{2,}
+        Sem\.\/(?:Annual|Year):\s*(?P<sem>.*?)\n
+        Institution\sCode:\s*\'?(?P<instCode>\d+)\'?\s{2,}
+        Institution:\s*(?P<instName>.*?)\n
+    """,
+        re.VERBOSE,
+    )
+
+    def __init__(self, schemePage: Page | PageContext):
+        self.ctx = PageContext.of(schemePage)
+        self.schemePage = self.ctx.page
+
+    @property
+    def schemeText(self):
+        return self.ctx.text
 
     def get_scheme_header(self):
         assert self.is_valid2()
@@ -178,7 +768,7 @@ class PTScheme:
                 }
             """
 
-            scheme = self.pattern.search(self.schemeText).groupdict()
+            scheme = self.ctx.search_header(self.pattern).groupdict()
             modifiedScheme = {**scheme}
             modifiedScheme["sem"] = semHeaderMap[modifiedScheme["sem"]]
             modifiedScheme["institutes"] = [
@@ -190,16 +780,47 @@ class PTScheme:
             # Modify scheme header here
             return modifiedScheme
         except AttributeError:
-            console.print("Failed to get scheme header", style="bold red")
+            log.error("Failed to get scheme header")
             return None
 
+    @staticmethod
+    def is_valid_table(table):
+        # Shape check for the template engine: a header row and rectangular body
+        return (
+            bool(table)
+            and "Max. Marks" in table[0]
+            and len(set(map(len, table))) == 1
+        )
+
     def get_scheme_table(self):
         assert self.is_valid2()
-        return self.schemePage.extract_table()
+        return self.ctx.extract_table(validate=self.is_valid_table)
+
+    def table_text(self):
+        # Page text below the scheme header, the same on every institute's copy of
+        # the page
+        match = self.ctx.search(self.pattern)
+        return self.ctx.text if match is None else self.ctx.text[match.end() :]
 
     def parse_scheme_table(self):
         header = self.get_scheme_header()
-        table = self.schemePage.extract_table()
+        fingerprints = None if self.ctx.tables is None else self.ctx.tables.fingerprints
+        key = None
+        if fingerprints is not None and header is not None:
+            key = fingerprints.key(header["schemeID"], self.table_text())
+            subjects = fingerprints.get(key)
+            self.ctx.metrics.count(
+                "schemeFingerprintMisses"
+                if subjects is None
+                else "schemeFingerprintHits"
+            )
+            if subjects is not None:
+                # A repeat, only its header (the institute) is new
+                return {**header} | {"subjects": dict(subjects)}
+        # Copy the rows, the context keeps the extracted table around
+        table = [
+            list(row) for row in self.ctx.extract_table(validate=self.is_valid_table)
+        ]
         # Modify scheme json
         scheme = {**header} | {"subjects": {}}
         """
@@ -247,75 +868,123 @@ class PTScheme:
                 "maxMarks": row[11],
                 "passMarks": row[12],
             }
+        if key is not None:
+            fingerprints.put(key, scheme["subjects"])
         return scheme
 
     def get_scheme_pretty(self):
         table = self.get_scheme()
+        import pandas as pd
+
         print(pd.DataFrame(table))
 
     def is_valid(self):
         return self.get_scheme_header() is not None
 
     def is_valid2(self):
+        if "SCHEME OF EXAMINATIONS" in self.ctx.header_text:
+            return True
         return self.schemeText.find("SCHEME OF EXAMINATIONS") != -1
 
 
 class PTResult:
-    def __init__(self, page: Page):
-        self.page = page
-        self.text = page.extract_text_simple()
+    r""" Older version (Works on newer result headers)
+    Programme\sCode:\s+(?P<prgCode>\d+)\s+
+    Programme\sName:\s+(?P<programme>.*?)\s+
+    Sem\.\/Year\/EU:\s+(?P<sem>.*?)\s+
+    Batch:\s+(?P<batch>\d+)\s+
+    Examination:\s+(?P<exam>.*?)\s+
+    Result\sDeclared\sDate\s*:\s*(?P<resultDate>.*?)\s+
+    """
 
-        r""" Older version (Works on newer result headers)
-        Programme\sCode:\s+(?P<prgCode>\d+)\s+
-        Programme\sName:\s+(?P<programme>.*?)\s+
-        Sem\.\/Year\/EU:\s+(?P<sem>.*?)\s+
-        Batch:\s+(?P<batch>\d+)\s+
-        Examination:\s+(?P<exam>.*?)\s+
-        Result\sDeclared\sDate\s*:\s*(?P<resultDate>.*?)\s+
-        """
+    r"""
+    Samples (extracted with extract_text_simple()):
+        Older header:
+            Result of Programme Code: 049     Programme Name: BACHELOR OF TECHNOLOGY (ELECTRICAL & ELECTRONICS ENGINEERING)     Sem./Year: 06 SEMESTER     Batch: 2020     Examination: RECHECKING REGULAR July, 2023\n
+        Newer header:
+            Programme Code: 027      Programme Name: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      Sem./Year/EU: THIRD SEMESTER      Batch: 2021      Examination: REAPPEAR DEC, 2023    Result Declared Date :08-FEB-24\n
+    """
 
+    # Works well on newer as well as older headers
+    pattern = re.compile(
         r"""
-        Samples (extracted with extract_text_simple()):
-            Older header:
-                Result of Programme Code: 049     Programme Name: BACHELOR OF TECHNOLOGY (ELECTRICAL & ELECTRONICS ENGINEERING)     Sem./Year: 06 SEMESTER     Batch: 2020     Examination: RECHECKING REGULAR July, 2023\n
-            Newer header:
-                Programme Code: 027      Programme Name: BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)      Sem./Year/EU: THIRD SEMESTER      Batch: 2021      Examination: REAPPEAR DEC, 2023    Result Declared Date :08-FEB-24\n
-        """
-
-        # Works well on newer as well as older headers
-        self.pattern = re.compile(
-            r"""
-            Programme\sCode:\s+(?P<prgCode>\d+)\s{2,}
-            Programme\sName:\s+(?P<programme>.*?)\s{2,}
-            Sem\.\/Year(?:\/EU)?:\s+(?P<sem>.*?)\s{2,}
-            Batch:\s*(?P<batch>\d+)\s{2,}
-            Examination:\s*(?P<exam>.*?)(?:\s{2,}|\n)
-            (?:Result\sDeclared\sDate\s*:\s*(?P<resultDate>.*?)\n)?
-        """,
-            re.VERBOSE,
-        )
+        Programme\sCode:\s+(?P<prgCode>\d+)\s{2,}
+        Programme\sName:\s+(?P<programme>.*?)\s{2,}
+        Sem\.\/Year(?:\/EU)?:\s+(?P<sem>.*?)\s{2,}
+        Batch:\s*(?P<batch>\d+)\s{2,}
+        Examination:\s*(?P<exam>.*?)(?:\s{2,}|\n)
+        (?:Result\sDeclared\sDate\s*:\s*(?P<resultDate>.*?)\n)?
+    """,
+        re.VERBOSE,
+    )
+
+    instPattern = re.compile(
+        r"Institution\sCode:\s*(?P<instCode>\d+)\s*Institution:\s*(?P<instName>.*)"
+    )
+
+    studentPattern = re.compile(
+        (
+            r"(?P<enrollment>\d+)\n(?P<name>.*?)\nSID:\s*(?P<sid>\d+)\nScheme"
+            r"ID:\s*(?P<schemeID>\d+)"
+        ),
+        re.DOTALL,
+    )
+
+    # Subject code cell, "ETCS301\n(4)" -> "ETCS301"
+    subjectPattern = re.compile(r"^(.*?)(?:\n\s*)?(?:\(\d+\))?\s*$")
+
+    # Total cell, "72(A+)" -> ("72", "A+") in one match, see split_total
+    markPattern = re.compile(r"(\d+|ABS|CAN)\s*\(([^()\s]{1,2})\)\Z")
+    totalPattern = re.compile(r"(\d+|ABS|CAN)?.?\s*\(?(?:.{1,2})?\)?.?")
+    gradePattern = re.compile(r"(?:\d+|ABS|CAN)?.?\s*\(?(.{1,2})\)?.?")
+
+    table_settings = {
+        "vertical_strategy": "lines",
+        "horizontal_strategy": "lines",
+        "explicit_vertical_lines": [],
+        "explicit_horizontal_lines": [],
+        "snap_tolerance": 3,
+        "snap_x_tolerance": 3,
+        "snap_y_tolerance": 8,
+        "join_tolerance": 3,
+        "join_x_tolerance": 3,
+        "join_y_tolerance": 15,
+        "edge_min_length": 3,
+        "min_words_vertical": 3,
+        "min_words_horizontal": 1,
+        "intersection_tolerance": 3,
+        "intersection_x_tolerance": 3,
+        "intersection_y_tolerance": 3,
+        "text_tolerance": 3,
+        "text_x_tolerance": 3,
+        "text_y_tolerance": 3,
+    }
+
+    def __init__(self, page: Page | PageContext):
+        self.ctx = PageContext.of(page)
+        self.page = self.ctx.page
+
+    @property
+    def text(self):
+        return self.ctx.text
 
     def get_result_header(self):
         try:
-            result = self.pattern.search(self.text).groupdict()
+            result = self.ctx.search_header(self.pattern).groupdict()
             result["sem"] = semHeaderMap[result["sem"]]
 
             # The following part tries to parse the result date,
-            # and update the cache with a valid result date if there isn't one
-            # if it fails, it tries to use the last parsed result date
-            # if that fails too, it removes the result date from the header
+            # if it fails, it uses the fallback date the parser picked for this page
+            # (the first valid result date before it, see Parser.fallback_date)
+            # if there is none, it removes the result date from the header
 
             if result["resultDate"] is not None:
-                try:
-                    result["resultDate"] = datetime.strptime(
-                        result["resultDate"], "%d-%b-%y"
-                    )
-                    if "resultDate" not in cache:
-                        cache["resultDate"] = result["resultDate"]
-                except ValueError:
-                    result["resultDate"] = cache.get("resultDate")
-                    if result["resultDate"] is None:
-                        result.pop("resultDate")
+                result["resultDate"] = (
+                    self.parse_result_date(result["resultDate"])
+                    or self.ctx.fallback_date
+                )
+                if result["resultDate"] is None:
+                    result.pop("resultDate")
                     # console.print(
                     #     "Failed to parse result date", style="bold red"
                     # )
@@ -325,56 +994,61 @@ class PTResult:
         except AttributeError:
             return None
 
+    @staticmethod
+    def parse_result_date(text: str):
+        try:
+            return datetime.strptime(text, "%d-%b-%y")
+        except (TypeError, ValueError):
+            return None
+
+    def get_result_date(self):
+        # The page's own result date, without any fallback
+        match = self.ctx.search_header(self.pattern)
+        return None if match is None else self.parse_result_date(match["resultDate"])
+
+    def uses_fallback_date(self):
+        # The page has a result date, but it can't be parsed
+        match = self.ctx.search_header(self.pattern)
+        return (
+            match is not None
+            and match["resultDate"] is not None
+            and self.parse_result_date(match["resultDate"]) is None
+        )
+
     def get_result_table(self):
         assert self.is_valid()
-        return self.page.extract_table()
+        return self.ctx.extract_table()
+
+    @classmethod
+    def is_valid_table(cls, table):
+        # Shape check for the template engine: institute row, then 3 rows per student
+        if not table or len(table[0]) < 3 or table[0][2] is None:
+            return False
+        if cls.instPattern.search(table[0][2]) is None or (len(table) - 1) % 3:
+            return False
+        for row in table[1::3]:
+            cells = [cell for cell in row if cell]
+            if not cells or cls.studentPattern.search(cells[0]) is None:
+                return False
+        return True
 
     @staticmethod
     def parse_student_details(text: str):
-        pattern = re.compile(
-            (
-                r"(?P<enrollment>\d+)\n(?P<name>.*?)\nSID:\s*(?P<sid>\d+)\nScheme"
-                r"ID:\s*(?P<schemeID>\d+)"
-            ),
-            re.DOTALL,
-        )
         try:
-            return re.search(pattern, text).groupdict()
+            return PTResult.studentPattern.search(text).groupdict()
         except AttributeError:
-            console.print("\nFailed to parse student details", style="bold red")
+            log.error("Failed to parse student details")
             return None
 
     def parse_result_table(self):
         # Retrieves institute info from table's first row not the page header
 
-        table_settings = {
-            "vertical_strategy": "lines",
-            "horizontal_strategy": "lines",
-            "explicit_vertical_lines": [],
-            "explicit_horizontal_lines": [],
-            "snap_tolerance": 3,
-            "snap_x_tolerance": 3,
-            "snap_y_tolerance": 8,
-            "join_tolerance": 3,
-            "join_x_tolerance": 3,
-            "join_y_tolerance": 15,
-            "edge_min_length": 3,
-            "min_words_vertical": 3,
-            "min_words_horizontal": 1,
-            "intersection_tolerance": 3,
-            "intersection_x_tolerance": 3,
-            "intersection_y_tolerance": 3,
-            "text_tolerance": 3,
-            "text_x_tolerance": 3,
-            "text_y_tolerance": 3,
-        }
+        pattern = self.instPattern
 
-        pattern = re.compile(
-            r"Institution\sCode:\s*(?P<instCode>\d+)\s*Institution:\s*(?P<instName>.*)"
+        extracted_table = self.ctx.extract_table(
+            self.table_settings, validate=self.is_valid_table
         )
 
-        extracted_table = self.page.extract_table(table_settings)
-
         # if extracted_table[0][0] != "S. No." and
         # special_case = False
 
@@ -383,9 +1057,8 @@ class PTResult:
             instInfo["instCode"] = int(instInfo["instCode"])
         except AttributeError:
             # console.print(f"Table header: {extracted_table[0]}", style="bold red")
-            console.print(
-                "\nFailed to get institute code from result table. Is this a result page?",
-                style="bold red",
+            log.error(
+                "Failed to get institute code from result table. Is this a result page?"
             )
 
             # special_case = True
@@ -426,27 +1099,61 @@ class PTResult:
 # WHAT THE FUCK ->
 
         table = n_clusters(extracted_table[1:], 3)
+        subjectPattern = self.subjectPattern
         result = []
         for row in table:
-            row[0] = list(filter(lambda x: x is not None and x != "", row[0]))
+            row[0] = [cell for cell in row[0] if cell]
             # i = \d+\(\d\) sometimes
             try:
                 # row[0] = [row[0][0]] + [i.split()[0] for i in row[0][1:]]
                 # print(row[0][1:])
                 # (.*?)\n?\s*\(\d\)
                 row[0] = [row[0][0]] + [
-                    re.match(r"^(.*?)(?:\n\s*)?(?:\(\d+\))?\s*$", i)[1] for i in row[0][1:]
+                    subjectPattern.match(cell)[1] for cell in row[0][1:]
                 ]
-                row[2] = [None] + list(filter(lambda x: x is not None, row[2]))
-                row[0][0] = self.parse_student_details(row[0][0]) | {
-                    "institute": instInfo
-                }
-            except IndexError or TypeError:
+                row[2] = [None] + [cell for cell in row[2] if cell is not None]
+                details = self.parse_student_details(row[0][0])
+                if details is None:
+                    # Skipped, the run goes on and the profile reports the failure
+                    self.ctx.metrics.count("studentDetailFailures")
+                    continue
+                row[0][0] = details | {"institute": instInfo}
+            except (IndexError, TypeError):
                 continue
             result.append(list(zip(row[0], n_clusters(row[1]), row[2])))
         return result
 
-    def parse_result_table_to_json(self, stdout: bool = False):
+    @classmethod
+    def split_total(cls, cell: str):
+        """
+        Splits a total cell into (total, grade), "72(A+)" -> ("72", "A+")
+        Well formed cells take a single match, anything else goes through the
+        original separate total and grade patterns, which are looser
+        """
+        match = cls.markPattern.match(cell)
+        if match is not None:
+            return match.groups()
+        return (
+            cls.totalPattern.match(cell)[1],
+            cls.gradePattern.match(cell)[1].strip("()"),
+        )
+
+    @staticmethod
+    def typed_marks(internal, external, total, grade) -> dict:
+        # Marks as integers (None when absent, cancelled or blank) with the ABS/CAN
+        # flags
+        marks = (internal, external, total)
+        return {
+            "internal": as_int(internal),
+            "external": as_int(external),
+            "total": as_int(total),
+            "totalGrade": grade,
+            "absent": "ABS" in marks,
+            "cancelled": "CAN" in marks,
+        }
+
+    def parse_result_table_to_json(self, stdout: bool = False, typed: bool = False):
+        # typed emits the marks through typed_marks instead of as the cells' strings
         studentResults = []
         header = self.get_result_header()
         if "resultDate" in header.keys():
@@ -465,39 +1172,40 @@ class PTResult:
             40-44: P
             0-39/ABS: F
         """
+        split_total = self.split_total
         for student in table:
             try:
-                result = {
+                details = {
                     **student[0][0],
                     "batch": header["batch"],
                     "prgCode": header["prgCode"],
                     "programme": header["programme"],
-                    "subjects": {
-                        subject[0]: {
-                            "internal": subject[1][0],
-                            "external": subject[1][1],
-                            "total": re.match(
-                                r"(\d+|ABS|CAN)?.?\s*\(?(?:.{1,2})?\)?.?", subject[2]
-                            )[1],
-                            # "total": subject[2].split()[0],
-                            # "totalGrade": subject[2].split()[1].strip("()"),
-                            "totalGrade": re.match(
-                                r"(?:\d+|ABS|CAN)?.?\s*\(?(.{1,2})\)?.?", subject[2]
-                            )[1].strip("()"),
-                        }
-                        for subject in student[1:]
-                    },
-                    "resultHeader": header,
                 }
+                subjects = {}
+                for code, (internal, external), cell in student[1:]:
+                    total, grade = split_total(cell)
+                    subjects[code] = (
+                        self.typed_marks(internal, external, total, grade)
+                        if typed
+                        else {
+                            "internal": internal,
+                            "external": external,
+                            "total": total,
+                            "totalGrade": grade,
+                        }
+                    )
             except TypeError:
                 continue
+            result = details | {"subjects": subjects, "resultHeader": header}
             studentResults.append(result)
             if stdout:
-                rprint(result, end="\r")
+                echo(result, end="\r")
         return studentResults
 
     def get_result_pretty(self):
         table = self.get_result()
+        import pandas as pd
+
         print(pd.DataFrame(table))
 
     def is_valid(self):
@@ -513,242 +1221,2623 @@ class enumPageType(StrEnum):
 
 
 class PageType:
-    def __init__(self, page: Page):
-        self.page = page
+    def __init__(self, page: Page | PageContext):
+        self.ctx = PageContext.of(page)
+        self.page = self.ctx.page
         self.ptype = self.get_page_type()
 
     def get_page_type(self):
-        if PTScheme(self.page).is_valid2():
+        # Cheap path, the page headers live in the top band of the page
+        header = self.ctx.header_text
+        if "SCHEME OF EXAMINATIONS" in header:
+            return enumPageType.SCHEME
+        if "Programme Code:" in header and PTResult(self.ctx).is_valid():
+            return enumPageType.RESULT
+
+        # Nothing conclusive in the header band, fall back to the full page check
+        if PTScheme(self.ctx).is_valid2():
             return enumPageType.SCHEME
-        elif PTResult(self.page).is_valid():
+        elif PTResult(self.ctx).is_valid():
             return enumPageType.RESULT
         else:
             return enumPageType.UNKNOWN
 
 
-class Parser:
-    def __init__(self, pages):
-        self.pages = pages
+class PageIndex:
+    """
+    Page index built by a prescan of the PDF
+    One entry per page with its type and header fields (schemeID, sem, batch,
+    prgCode, instCode, resultDate), read with the header regexes from the header band
+    only, no table is extracted. Saved as a small JSON sidecar next to the PDF,
+    the multiprocess scheduler plans its chunks with it, and it gives every page
+    the same result date fallback no matter how the pages are split across workers
+    """
 
-    def parse(
-        self,
-        result_path: str = RESULT_PATH,
-        scheme_path: str = SCHEME_PATH,
-        stdout_scheme: bool = False,
-        stdout_result: bool = False,
-        write_to_file: bool = True,
-    ):
-        schemes = dict()
-        studentResults = []
-        repeatedSchemeCount = 0
-        task = progress.add_task("Parsing", total=len(self.pages))
-        with progress:
-            for page in self.pages:
-                pt = PageType(page)
-                rprint("Parsing Page: ", page.page_number, end="\r", flush=True)
-                if pt.ptype == enumPageType.SCHEME:
-                    scheme = PTScheme(page)
-                    header = scheme.get_scheme_header()
-                    parsed_scheme_table = scheme.parse_scheme_table()
-                    if header["schemeID"] not in schemes:
-                        schemes[header["schemeID"]] = parsed_scheme_table
-                    else:
-                        if (
-                            header["institutes"][0]
-                            not in schemes[header["schemeID"]]["institutes"]
-                        ):
-                            schemes[header["schemeID"]]["institutes"].append(
-                                header["institutes"][0]
-                            )
-                        repeatedSchemeCount += 1
+    VERSION = 1
+    schemeIDPattern = re.compile(r"SchemeID:\s*(?P<schemeID>\d+)")
 
-                        # Still append the subjects
-                        schemes[header["schemeID"]].update(
-                            {
-                                "subjects": {
-                                    **schemes[header["schemeID"]]["subjects"],
-                                    **parsed_scheme_table["subjects"],
-                                }
-                            }
-                        )
+    def __init__(self, entries, source=None):
+        self.entries = entries
+        self.source = source
+        self.by_page = {entry["page"]: entry for entry in entries}
+        # The page with the first valid result date of the PDF
+        self.first_result_date = min(
+            (
+                (entry["page"], entry["resultDate"])
+                for entry in entries
+                if entry["resultDate"] is not None
+            ),
+            default=None,
+        )
 
-                        if stdout_scheme:
-                            rprint("Repeated Scheme: ", header["schemeID"])
-                            rprint(schemes[header["schemeID"]])
-                # elif pt.ptype == enumPageType.RESULT:
-                #     # result = PTResult(page)
-                #     pass
-                elif pt.ptype == enumPageType.RESULT:
-                    ptresult = PTResult(page).parse_result_table_to_json(
-                        stdout=stdout_result
-                    )
-                    studentResults.extend(ptresult)
+    @staticmethod
+    def sidecar_path(pdf_path: str):
+        return pdf_path + ".index.json"
 
-                else:
-                    rprint("Unknown Page Type: ", pt.ptype)
-
-                # Fix for memory leak
-                page.flush_cache()
-                progress.update(
-                    task,
-                    advance=1,
-                    description=f"[bold blue]Paring Page:[/] {page.page_number}",
+    @staticmethod
+    def fingerprint(pdf_path: str):
+        stat = os.stat(pdf_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    @classmethod
+    def describe(cls, ctx: PageContext):
+        ptype = PageType(ctx).ptype
+        entry = dict.fromkeys(
+            ["schemeID", "sem", "batch", "prgCode", "instCode", "resultDate"]
+        )
+        entry = {"page": ctx.page_number, "type": str(ptype), **entry}
+        if ptype == enumPageType.SCHEME:
+            header = PTScheme(ctx).get_scheme_header()
+            if header is not None:
+                entry["schemeID"] = header["schemeID"]
+                entry["sem"] = header["sem"]
+                entry["prgCode"] = header["prgCode"]
+                entry["instCode"] = header["institutes"][0]["instCode"]
+        elif ptype == enumPageType.RESULT:
+            header = ctx.search_header(PTResult.pattern).groupdict()
+            entry["sem"] = semHeaderMap.get(header["sem"])
+            entry["batch"] = header["batch"]
+            entry["prgCode"] = header["prgCode"]
+            date = PTResult.parse_result_date(header["resultDate"])
+            entry["resultDate"] = None if date is None else date.isoformat()
+            # The institute row and the first student usually sit in the header band
+            inst = PTResult.instPattern.search(ctx.header_text)
+            if inst is not None:
+                entry["instCode"] = inst["instCode"]
+            scheme = cls.schemeIDPattern.search(ctx.header_text)
+            if scheme is not None:
+                entry["schemeID"] = scheme["schemeID"]
+        return entry
+
+    @staticmethod
+    def index_chunk(task):
+        # Multiprocess worker task, see ParserSenpai.init_worker
+        pdf_path, page_numbers, text_backend = task
+        pdf = worker_pdf(pdf_path)
+        text = worker_text(pdf_path, text_backend)
+        entries = []
+        for page_number in page_numbers:
+            ctx = PageContext(pdf.pages[page_number - 1], text_backend=text)
+            entries.append(PageIndex.describe(ctx))
+            ctx.flush()
+        return entries
+
+    @classmethod
+    def build(cls, pdf_path: str, workers: int = 1, text_backend: str = "pdfplumber"):
+        with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+            page_count = len(pdf.pages)
+            if workers <= 1:
+                entries = []
+                for page in pdf.pages:
+                    ctx = PageContext(page, text_backend=text)
+                    entries.append(cls.describe(ctx))
+                    ctx.flush()
+                return cls(entries, cls.fingerprint(pdf_path))
+
+        chunks = plan_chunks(range(1, page_count + 1), workers)
+        with Pool(
+            processes=max(1, min(workers, len(chunks))),
+            initializer=ParserSenpai.init_worker,
+            initargs=(False,),
+        ) as pool:
+            entries = [
+                entry
+                for chunk in pool.imap(
+                    cls.index_chunk,
+                    [(pdf_path, chunk, text_backend) for chunk in chunks],
                 )
+                for entry in chunk
+            ]
+        return cls(entries, cls.fingerprint(pdf_path))
 
-        progress.update(task, completed=True, visible=False)
+    @classmethod
+    def load(cls, index_path: str, pdf_path: str = None):
+        # Returns None if there is no index or it was built for another version of
+        # the PDF
+        try:
+            with open(index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != cls.VERSION:
+            return None
+        if pdf_path is not None and data.get("source") != cls.fingerprint(pdf_path):
+            return None
+        return cls(data["pages"], data.get("source"))
+
+    @classmethod
+    def load_or_build(
+        cls,
+        pdf_path: str,
+        index_path: str = None,
+        workers: int = 1,
+        text_backend: str = "pdfplumber",
+    ):
+        index_path = index_path or cls.sidecar_path(pdf_path)
+        index = cls.load(index_path, pdf_path)
+        if index is None:
+            index = cls.build(pdf_path, workers, text_backend)
+            index.save(index_path)
+        return index
+
+    def save(self, index_path: str):
+        with open(index_path, "w") as f:
+            json.dump(
+                {"version": self.VERSION, "source": self.source, "pages": self.entries},
+                f,
+            )
 
-        if write_to_file:
+    def page_type(self, page_number: int):
+        entry = self.by_page.get(page_number)
+        return None if entry is None else enumPageType(entry["type"])
 
-            # with open(result_path, "w") as f:
-            #     f.write("Length: " + str(len(studentResults)) + "\n\n")
-            #     for result in studentResults:
-            #         f.write(json.dumps(result, indent=4) + "\n\n")
+    def layout(self, page_number: int):
+        # Pages of one layout share their table grid, see TableTemplates
+        entry = self.by_page.get(page_number)
+        if entry is None:
+            return None
+        return entry["type"], entry["prgCode"], entry["sem"]
 
-            with open(result_path, "w") as f:
-                console.print("\nLength Student Jsons: " + str(len(studentResults)))
-                f.write(json.dumps(studentResults, indent=4))
+    def result_date_before(self, page_number: int):
+        # First valid result date on any page before page_number
+        if self.first_result_date is None or self.first_result_date[0] >= page_number:
+            return None
+        return datetime.fromisoformat(self.first_result_date[1])
 
-            with open(scheme_path, "w") as f:
-                console.print("Length Scheme Jsons: " + str(len(schemes)))
-                console.print(
-                    "Repeated Scheme Count: " + str(repeatedSchemeCount) + "\n\n"
-                )
-                # for _, value in schemes.items():
-                #     f.write(json.dumps(value, indent=4) + "\n\n")
-                f.write(json.dumps(list(schemes.values()), indent=4))
 
-        return list(schemes.values()), studentResults, repeatedSchemeCount
+class PageCache:
+    """
+    Persistent per-page parse cache
+    Pages are keyed by a hash of their content streams, the parser version and
+    anything else that changes their output (e.g. the result date fallback),
+    a re-published PDF only re-parses the pages that actually changed.
+    Entries are JSON files under cache_dir, the least recently used ones are
+    evicted once the cache grows past max_bytes
+    """
 
-    @staticmethod
-    def parse_page(
-        page_chunk,
-        pdf_path,
-        shared_repeatedSchemeCount,
-        shared_result,
-        shared_scheme,
-        stdout_scheme,
-        stdout_result,
-    ):
-        schemes = []
-        studentResults = []
-        repeatedSchemeCount = 0
-        with pdfplumber.open(pdf_path) as pdf:
-            pages = [pdf.pages[page_num - 1] for page_num in page_chunk]
-            """with progress:
-                for page in pages:
-                    pt = PageType(page)
-                    rprint("Parsing Page: ", page.page_number, end="\r", flush=True)
-                    if pt.ptype == enumPageType.SCHEME:
-                        scheme = PTScheme(page)
-                        header = scheme.get_scheme_header()
-                        parsed_scheme_table = scheme.parse_scheme_table()
-                        if header["schemeID"] not in schemes:
-                            schemes[header["schemeID"]] = parsed_scheme_table
-                        else:
-                            schemes[header["schemeID"]]["institutes"].append(
-                                header["institutes"][0]
-                            )
-                            repeatedSchemeCount += 1
-                            if stdout_scheme:
-                                rprint("Repeated Scheme: ", header["schemeID"])
-                                rprint(schemes[header["schemeID"]])
-                    # elif pt.ptype == enumPageType.RESULT:
-                    #     # result = PTResult(page)
-                    #     pass
-                    else:
-                        ptresult = PTResult(page).parse_result_table_to_json(
-                            stdout=stdout_result
-                        )
-                        studentResults.extend(ptresult)
+    # Bump when the cached page output changes shape
+    VERSION = 1
 
-                    # Fix for memory leak
-                    page.flush_cache()"""
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = None
+        self.hits = 0
+        self.misses = 0
 
-            data = Parser(pages).parse(
-                write_to_file=False,
-                stdout_result=stdout_result,
-                stdout_scheme=stdout_scheme,
-            )
-            schemes.extend(data[0])
-            studentResults.extend(data[1])
-            repeatedSchemeCount += data[2]
+    def __getstate__(self):
+        # Workers get their own counters and size estimate
+        return {"cache_dir": self.cache_dir, "max_bytes": self.max_bytes}
 
-        shared_repeatedSchemeCount.value += repeatedSchemeCount
-        shared_result.extend(studentResults)
-        shared_scheme.extend(schemes)
+    def __setstate__(self, state):
+        self.__init__(**state)
 
+    def key(self, page: Page, *parts):
+        from pdfminer.pdftypes import resolve1
 
-class ParserSenpai:
-    @staticmethod
-    def multiprocessing_parser(
-        pdf_path: str = PDF_PATH,
-        stdout_result: bool = False,
-        stdout_scheme: bool = False,
-        result_path: str = RESULT_PATH,
-        scheme_path: str = SCHEME_PATH,
-        write_to_file: bool = True,
-    ):
-        with Manager() as manager:
-            shared_result = manager.list()
-            shared_scheme = manager.list()
-            shared_repeatedSchemeCount = manager.Value(int, 0)
-
-            with pdfplumber.open(pdf_path) as pdf:
-                page_range = range(0, len(pdf.pages))
-
-            # tested with a few runs, 100 pages per worker seems to be the sweet spot
-            pages_per_worker = 100
-            page_chunks = [
-                list(group)
-                for _, group in groupby(page_range, lambda x: x // pages_per_worker)
-            ]
+        digest = hashlib.sha256(f"{__version__}:{self.VERSION}".encode())
+        digest.update(repr((page.width, page.height, parts)).encode())
+        for stream in page.page_obj.contents:
+            digest.update(resolve1(stream).get_data())
+        return digest.hexdigest()
 
-            with Pool(processes=4) as pool:
-                pool.starmap(
-                    Parser.parse_page,
-                    [
-                        (
-                            page_chunk,
-                            pdf_path,
-                            shared_repeatedSchemeCount,
-                            shared_result,
-                            shared_scheme,
-                            stdout_scheme,
-                            stdout_result,
-                        )
-                        for page_chunk in page_chunks
-                    ],
-                )
+    def _path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
 
-            final_result = list(shared_result)
-            final_scheme = list(shared_scheme)
-            final_repeatedSchemeCount = shared_repeatedSchemeCount.value
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Recently used entries are evicted last
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+        if self.size is None:
+            self.size = self._scan()[1]
+        else:
+            self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries, sum(size for _, size, _ in entries)
+
+    def evict(self):
+        # Drop the least recently used entries until the cache is at 90% of its limit
+        entries, total = self._scan()
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.size = total
 
-        if write_to_file:
 
-            # with open(result_path, "w") as f:
-            #     f.write("Length: " + str(len(studentResults)) + "\n\n")
-            #     for result in studentResults:
-            #         f.write(json.dumps(result, indent=4) + "\n\n")
+class JSONWriter:
+    """
+    Default output, indented JSON arrays written once the parse is done
+    """
 
-            with open(result_path, "w") as f:
-                console.print(
-                    "\nLength Student Jsons: " + str(len(final_result)), style="bold blue"
-                )
-                f.write(json.dumps(final_result, indent=4))
+    streaming = False
 
-            with open(scheme_path, "w") as f:
-                console.print(
-                    "Length Scheme Jsons: " + str(len(final_scheme)), style="bold blue"
+    def __init__(self, result_path: str = RESULT_PATH, scheme_path: str = SCHEME_PATH):
+        self.result_path = result_path
+        self.scheme_path = scheme_path
+        self.results = []
+        self.schemes = []
+
+    @property
+    def result_count(self):
+        return len(self.results)
+
+    @property
+    def scheme_count(self):
+        return len(self.schemes)
+
+    def write_results(self, results):
+        self.results.extend(results)
+
+    def write_schemes(self, schemes):
+        self.schemes.extend(schemes)
+
+    def close(self):
+        with open(self.result_path, "w") as f:
+            json.dump(self.results, f, indent=4)
+        with open(self.scheme_path, "w") as f:
+            json.dump(self.schemes, f, indent=4)
+
+
+class NDJSONWriter:
+    """
+    Streaming output, one JSON record per line
+    Student records are written (and flushed) as soon as their page is parsed,
+    so memory stays flat and readers can start on the file before the parse ends.
+    Schemes are written when they are final, i.e. when the parse ends,
+    since a repeated scheme page can still add institutes and subjects
+    """
+
+    streaming = True
+
+    # The multiprocess parser has its workers encode the lines for this writer
+    encodes_lines = True
+
+    def __init__(
+        self,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        index_path: str = None,
+    ):
+        self.result_file = open(result_path, "w")
+        self.scheme_file = open(scheme_path, "w")
+        self.result_count = 0
+        self.scheme_count = 0
+        # Enrollment index entries of the lines written so far, see EnrollmentIndex
+        self.index_path = index_path
+        self.index_entries = [] if index_path is not None else None
+        self.offset = 0
+
+    @staticmethod
+    def encode(records):
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def write_results(self, results):
+        self.write_lines(self.encode(results), len(results))
+
+    def write_lines(self, lines: str, count: int):
+        # Results already encoded by encode(), e.g. in a worker process
+        self.result_file.write(lines)
+        self.result_file.flush()
+        self.result_count += count
+        if self.index_entries is not None:
+            # json.dumps escapes anything but ASCII, a character is a byte
+            for line in lines.splitlines(keepends=True):
+                self.index_entries.append(EnrollmentIndex.entry(line, self.offset))
+                self.offset += len(line)
+
+    def write_schemes(self, schemes):
+        self.scheme_file.write(self.encode(schemes))
+        self.scheme_file.flush()
+        self.scheme_count += len(schemes)
+
+    def close(self):
+        self.result_file.close()
+        self.scheme_file.close()
+        if self.index_entries is not None:
+            EnrollmentIndex.write(self.index_path, self.index_entries, self.offset)
+
+
+class EnrollmentIndex:
+    """
+    On-disk index of an NDJSON result output, for single student lookups
+    Every line is one fixed width entry (enrollment, schemeID, instCode, byte offset
+    and length of the line), sorted by enrollment. A lookup binary searches the
+    entries with seeks and reads only the matching lines, so it takes a few reads
+    and constant memory whatever the size of the output. Written next to the output
+    (result.ndjson.idx) by NDJSONWriter, or built later from the file
+    """
+
+    MAGIC = b"PSENRIX1"
+    # magic, entry count, size of the output it indexes
+    HEADER = struct.Struct(">8sQQ")
+    ENTRY = struct.Struct(">16s16sIQI")
+
+    enrollmentPattern = re.compile(rb'"enrollment": "([^"]*)"')
+    schemeIDPattern = re.compile(rb'"schemeID": "([^"]*)"')
+    instCodePattern = re.compile(rb'"instCode": "?(\d+)')
+
+    def __init__(self, result_path: str, index_path: str = None):
+        self.result_path = result_path
+        self.index_file = open(index_path or self.sidecar_path(result_path), "rb")
+        magic, self.count, size = self.HEADER.unpack(
+            self.index_file.read(self.HEADER.size)
+        )
+        if magic != self.MAGIC:
+            self.index_file.close()
+            raise ValueError(f"{self.index_file.name} is not an enrollment index")
+        if size != os.path.getsize(result_path):
+            self.index_file.close()
+            raise ValueError(
+                f"{self.index_file.name} is out of date with {result_path}"
+            )
+        self.result_file = open(result_path, "rb")
+
+    @staticmethod
+    def sidecar_path(result_path: str):
+        return result_path + ".idx"
+
+    @classmethod
+    def key(cls, value) -> bytes:
+        return str(value).encode()[:16]
+
+    @classmethod
+    def entry(cls, line, offset: int) -> bytes:
+        if isinstance(line, str):
+            line = line.encode()
+        match = cls.enrollmentPattern.search(line)
+        scheme = cls.schemeIDPattern.search(line)
+        inst = cls.instCodePattern.search(line)
+        return cls.ENTRY.pack(
+            match[1][:16] if match else b"",
+            scheme[1][:16] if scheme else b"",
+            int(inst[1]) if inst else 0,
+            offset,
+            len(line),
+        )
+
+    @classmethod
+    def write(cls, index_path: str, entries, size: int):
+        # Packed entries sort by enrollment first, their leading field
+        entries.sort()
+        tmp = f"{index_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(entries), size))
+            f.writelines(entries)
+        os.replace(tmp, index_path)
+
+    @classmethod
+    def build(cls, result_path: str, index_path: str = None):
+        # Index of an existing NDJSON output, every line must be one JSON object
+        entries = []
+        offset = 0
+        with open(result_path, "rb") as f:
+            for line in f:
+                record = line.strip()
+                if record:
+                    if record[:1] != b"{" or record[-1:] != b"}":
+                        raise ValueError(
+                            f"{result_path} is not an NDJSON output, "
+                            "re-run with -f ndjson"
+                        )
+                    entries.append(cls.entry(line, offset))
+                offset += len(line)
+        cls.write(index_path or cls.sidecar_path(result_path), entries, offset)
+
+    @classmethod
+    def open(cls, result_path: str, index_path: str = None):
+        # Opens the index, (re)building it when it's missing or out of date
+        try:
+            return cls(result_path, index_path)
+        except (OSError, ValueError):
+            cls.build(result_path, index_path)
+            return cls(result_path, index_path)
+
+    def _entry(self, i: int):
+        self.index_file.seek(self.HEADER.size + i * self.ENTRY.size)
+        return self.ENTRY.unpack(self.index_file.read(self.ENTRY.size))
+
+    def lookup(self, enrollment, scheme_id=None, inst_code: int = None):
+        """
+        Records of the student, one per result (e.g. per semester), optionally only
+        those of a schemeID and/or an instCode
+        """
+        key = self.key(enrollment).ljust(16, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        records = []
+        for i in range(low, self.count):
+            entry_enrollment, entry_scheme, entry_inst, offset, length = self._entry(i)
+            if entry_enrollment != key:
+                break
+            if scheme_id is not None and entry_scheme.rstrip(b"\0") != self.key(
+                scheme_id
+            ):
+                continue
+            if inst_code is not None and entry_inst != int(inst_code):
+                continue
+            self.result_file.seek(offset)
+            records.append(json.loads(self.result_file.read(length)))
+        return records
+
+    def close(self):
+        self.index_file.close()
+        self.result_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def as_int(value):
+    # Marks, credits and codes as numbers, None for ABS, CAN, blank cells and the like
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ColumnarTable:
+    """
+    One long format table written in batches of rows
+    Rows are buffered column by column and written as a Parquet row group,
+    an Arrow record batch or CSV lines every BATCH_ROWS rows
+    """
+
+    BATCH_ROWS = 1 << 16
+
+    def __init__(self, path: str, columns: dict, table_format: str):
+        self.columns = {name: [] for name in columns}
+        self.table_format = table_format
+        self.pending = 0
+        if table_format == "csv":
+            self.file = open(path, "w", newline="")
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(columns)
+            return
+
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [(name, getattr(pa, kind)()) for name, kind in columns.items()]
+        )
+        if table_format == "parquet":
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def append(self, row):
+        for column, value in zip(self.columns.values(), row):
+            column.append(value)
+        self.pending += 1
+        if self.pending >= self.BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.table_format == "csv":
+            self.csv.writerows(zip(*self.columns.values()))
+        else:
+            self.writer.write_table(
+                self.pa.Table.from_pydict(self.columns, schema=self.schema)
+            )
+        for column in self.columns.values():
+            column.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        if self.table_format == "csv":
+            self.file.close()
+        else:
+            self.writer.close()
+
+
+class ColumnarWriter:
+    """
+    Long format, typed tables for analytics instead of nested JSON
+    Results get one row per (student, subject) with the marks as integers
+    (None for ABS, CAN and blank cells), schemes one row per (scheme, subject)
+    Parquet and Arrow need pyarrow, without it both fall back to CSV
+    """
+
+    streaming = True
+    table_format = "csv"
+
+    RESULT_COLUMNS = {
+        "enrollment": "string",
+        "subjectCode": "string",
+        "internal": "int16",
+        "external": "int16",
+        "total": "int16",
+        "grade": "string",
+        "schemeID": "string",
+        "instCode": "int32",
+        "sem": "int16",
+        "batch": "string",
+    }
+
+    SCHEME_COLUMNS = {
+        "schemeID": "string",
+        "prgCode": "string",
+        "sem": "int16",
+        "subjectCode": "string",
+        "paperID": "string",
+        "paperName": "string",
+        "credits": "int16",
+        "type": "string",
+        "exam": "string",
+        "mode": "string",
+        "kind": "string",
+        "minor": "int16",
+        "major": "int16",
+        "maxMarks": "int16",
+        "passMarks": "int16",
+    }
+
+    def __init__(self, result_path: str = RESULT_PATH, scheme_path: str = SCHEME_PATH):
+        table_format = self.table_format
+        if table_format != "csv":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                log.warning(
+                    "pyarrow is not installed, writing CSV instead of %s", table_format
+                )
+                table_format = "csv"
+                result_path = os.path.splitext(result_path)[0] + ".csv"
+                scheme_path = os.path.splitext(scheme_path)[0] + ".csv"
+        self.results = ColumnarTable(result_path, self.RESULT_COLUMNS, table_format)
+        self.schemes = ColumnarTable(scheme_path, self.SCHEME_COLUMNS, table_format)
+        self.result_count = 0
+        self.scheme_count = 0
+
+    def write_results(self, results):
+        for result in results:
+            sem = as_int(result.get("resultHeader", {}).get("sem"))
+            instCode = as_int(result["institute"].get("instCode"))
+            for subjectCode, marks in result["subjects"].items():
+                self.results.append(
+                    (
+                        result["enrollment"],
+                        subjectCode,
+                        as_int(marks["internal"]),
+                        as_int(marks["external"]),
+                        as_int(marks["total"]),
+                        marks["totalGrade"],
+                        result["schemeID"],
+                        instCode,
+                        sem,
+                        result["batch"],
+                    )
+                )
+        self.result_count += len(results)
+
+    def write_schemes(self, schemes):
+        for scheme in schemes:
+            for subjectCode, subject in scheme["subjects"].items():
+                self.schemes.append(
+                    (
+                        scheme["schemeID"],
+                        scheme.get("prgCode"),
+                        as_int(scheme.get("sem")),
+                        subjectCode,
+                        subject["paperID"],
+                        subject["paperName"],
+                        as_int(subject["credits"]),
+                        subject["type"],
+                        subject["exam"],
+                        subject["mode"],
+                        subject["kind"],
+                        as_int(subject["minor"]),
+                        as_int(subject["major"]),
+                        as_int(subject["maxMarks"]),
+                        as_int(subject["passMarks"]),
+                    )
+                )
+        self.scheme_count += len(schemes)
+
+    def close(self):
+        self.results.close()
+        self.schemes.close()
+
+
+class ParquetWriter(ColumnarWriter):
+    table_format = "parquet"
+
+
+class ArrowWriter(ColumnarWriter):
+    table_format = "arrow"
+
+
+class SQLiteWriter:
+    """
+    Writes the parse straight into a SQLite database at result_path
+    (scheme_path is unused), normalized into institutes, schemes, scheme_institutes,
+    subjects, students and marks tables
+    Rows are buffered and inserted with executemany, inside one transaction per
+    COMMIT_ROWS rows, with the database in WAL mode. Every insert is an upsert on the
+    table's key, marks on enrollment + schemeID + subject code, so parsing a PDF
+    again updates the rows instead of duplicating them
+    """
+
+    streaming = True
+
+    BATCH_ROWS = 1 << 14
+    COMMIT_ROWS = 1 << 18
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS institutes (
+            instCode INTEGER PRIMARY KEY,
+            instName TEXT
+        );
+        CREATE TABLE IF NOT EXISTS schemes (
+            schemeID TEXT PRIMARY KEY,
+            prgCode TEXT,
+            programme TEXT,
+            sem INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS scheme_institutes (
+            schemeID TEXT,
+            instCode INTEGER,
+            PRIMARY KEY (schemeID, instCode)
+        );
+        CREATE TABLE IF NOT EXISTS subjects (
+            schemeID TEXT,
+            subjectCode TEXT,
+            paperID TEXT,
+            paperName TEXT,
+            credits INTEGER,
+            type TEXT,
+            exam TEXT,
+            mode TEXT,
+            kind TEXT,
+            minor INTEGER,
+            major INTEGER,
+            maxMarks INTEGER,
+            passMarks INTEGER,
+            PRIMARY KEY (schemeID, subjectCode)
+        );
+        CREATE TABLE IF NOT EXISTS students (
+            enrollment TEXT PRIMARY KEY,
+            name TEXT,
+            sid TEXT,
+            instCode INTEGER,
+            prgCode TEXT,
+            batch TEXT
+        );
+        CREATE TABLE IF NOT EXISTS marks (
+            enrollment TEXT,
+            schemeID TEXT,
+            subjectCode TEXT,
+            internal INTEGER,
+            external INTEGER,
+            total INTEGER,
+            grade TEXT,
+            sem INTEGER,
+            exam TEXT,
+            resultDate TEXT,
+            PRIMARY KEY (enrollment, schemeID, subjectCode)
+        );
+    """
+
+    # table: (columns, key columns)
+    TABLES = {
+        "institutes": (("instCode", "instName"), ("instCode",)),
+        "schemes": (("schemeID", "prgCode", "programme", "sem"), ("schemeID",)),
+        "scheme_institutes": (("schemeID", "instCode"), ("schemeID", "instCode")),
+        "subjects": (
+            (
+                "schemeID",
+                "subjectCode",
+                "paperID",
+                "paperName",
+                "credits",
+                "type",
+                "exam",
+                "mode",
+                "kind",
+                "minor",
+                "major",
+                "maxMarks",
+                "passMarks",
+            ),
+            ("schemeID", "subjectCode"),
+        ),
+        "students": (
+            ("enrollment", "name", "sid", "instCode", "prgCode", "batch"),
+            ("enrollment",),
+        ),
+        "marks": (
+            (
+                "enrollment",
+                "schemeID",
+                "subjectCode",
+                "internal",
+                "external",
+                "total",
+                "grade",
+                "sem",
+                "exam",
+                "resultDate",
+            ),
+            ("enrollment", "schemeID", "subjectCode"),
+        ),
+    }
+
+    def __init__(self, result_path: str = RESULT_PATH, scheme_path: str = SCHEME_PATH):
+        import sqlite3
+
+        # Transactions are managed here, not by the sqlite3 module
+        self.db = sqlite3.connect(result_path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self.statements = {
+            table: self.upsert(table, columns, key)
+            for table, (columns, key) in self.TABLES.items()
+        }
+        self.rows = {table: [] for table in self.TABLES}
+        self.uncommitted = 0
+        self.result_count = 0
+        self.scheme_count = 0
+        self.db.execute("BEGIN")
+
+    @staticmethod
+    def upsert(table: str, columns, key) -> str:
+        updates = [column for column in columns if column not in key]
+        on_conflict = (
+            "DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in updates)
+            if updates
+            else "DO NOTHING"
+        )
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(key)}) {on_conflict}"
+        )
+
+    def add(self, table: str, row: tuple):
+        rows = self.rows[table]
+        rows.append(row)
+        if len(rows) >= self.BATCH_ROWS:
+            self.flush(table)
+
+    def flush(self, table: str):
+        rows = self.rows[table]
+        if not rows:
+            return
+        self.db.executemany(self.statements[table], rows)
+        self.uncommitted += len(rows)
+        rows.clear()
+        if self.uncommitted >= self.COMMIT_ROWS:
+            self.db.execute("COMMIT")
+            self.db.execute("BEGIN")
+            self.uncommitted = 0
+
+    def write_results(self, results):
+        for result in results:
+            header = result.get("resultHeader", {})
+            institute = result["institute"]
+            self.add("institutes", (institute["instCode"], institute["instName"]))
+            self.add(
+                "students",
+                (
+                    result["enrollment"],
+                    result["name"],
+                    result["sid"],
+                    institute["instCode"],
+                    result["prgCode"],
+                    result["batch"],
+                ),
+            )
+            for subjectCode, marks in result["subjects"].items():
+                self.add(
+                    "marks",
+                    (
+                        result["enrollment"],
+                        result["schemeID"],
+                        subjectCode,
+                        marks["internal"],
+                        marks["external"],
+                        marks["total"],
+                        marks["totalGrade"],
+                        header.get("sem"),
+                        header.get("exam"),
+                        header.get("resultDate"),
+                    ),
+                )
+        self.result_count += len(results)
+
+    def write_schemes(self, schemes):
+        for scheme in schemes:
+            self.add(
+                "schemes",
+                (
+                    scheme["schemeID"],
+                    scheme.get("prgCode"),
+                    scheme.get("programme"),
+                    scheme.get("sem"),
+                ),
+            )
+            for institute in scheme["institutes"]:
+                self.add("institutes", (institute["instCode"], institute["instName"]))
+                self.add(
+                    "scheme_institutes", (scheme["schemeID"], institute["instCode"])
+                )
+            for subjectCode, subject in scheme["subjects"].items():
+                self.add(
+                    "subjects",
+                    (
+                        scheme["schemeID"],
+                        subjectCode,
+                        subject["paperID"],
+                        subject["paperName"],
+                        subject["credits"],
+                        subject["type"],
+                        subject["exam"],
+                        subject["mode"],
+                        subject["kind"],
+                        subject["minor"],
+                        subject["major"],
+                        subject["maxMarks"],
+                        subject["passMarks"],
+                    ),
+                )
+        self.scheme_count += len(schemes)
+
+    def close(self):
+        for table in self.TABLES:
+            self.flush(table)
+        self.db.execute("COMMIT")
+        self.db.close()
+
+
+WRITERS = {
+    "json": JSONWriter,
+    "ndjson": NDJSONWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowWriter,
+    "csv": ColumnarWriter,
+    "sqlite": SQLiteWriter,
+}
+
+
+class Normalizer:
+    """
+    Normalized student records
+    Every distinct result header and institute is kept once under an ID, records
+    reference them with headerID and instID instead of carrying their own copies
+    (batch, prgCode and programme are part of the header). Subject codes, marks
+    and grades are interned, so repeated values share one string in memory
+    """
+
+    def __init__(self):
+        self.headers = {}
+        self.institutes = {}
+
+    @staticmethod
+    def ref(table: dict, value: dict) -> int:
+        key = tuple(sorted(value.items()))
+        if key not in table:
+            table[key] = (len(table), value)
+        return table[key][0]
+
+    def normalize(self, record: dict) -> dict:
+        # In place, so callers that keep the records don't keep the copies around
+        record["headerID"] = self.ref(self.headers, record.pop("resultHeader"))
+        record["instID"] = self.ref(self.institutes, record.pop("institute"))
+        for key in ("batch", "prgCode", "programme"):
+            record.pop(key, None)
+        record["schemeID"] = sys.intern(record["schemeID"])
+        record["subjects"] = {
+            sys.intern(code): {
+                field: sys.intern(value) if isinstance(value, str) else value
+                for field, value in marks.items()
+            }
+            for code, marks in record.pop("subjects").items()
+        }
+        return record
+
+    def refs(self) -> dict:
+        return {
+            "resultHeaders": [
+                {"headerID": id, **header} for id, header in self.headers.values()
+            ],
+            "institutes": [
+                {"instID": id, **institute}
+                for id, institute in self.institutes.values()
+            ],
+        }
+
+
+class NormalizedWriter:
+    """
+    Wraps a JSON or NDJSON writer for normalized output
+    The records are normalized before they reach the writer, and the headers and
+    institutes they reference are written to refs_path once the parse is done
+    """
+
+    # Header and institute IDs are handed out in the parent, in page order
+    encodes_lines = False
+
+    def __init__(self, writer, refs_path: str):
+        self.writer = writer
+        self.refs_path = refs_path
+        self.streaming = writer.streaming
+        self.normalizer = Normalizer()
+
+    @property
+    def result_count(self):
+        return self.writer.result_count
+
+    @property
+    def scheme_count(self):
+        return self.writer.scheme_count
+
+    def write_results(self, results):
+        self.writer.write_results(
+            [self.normalizer.normalize(result) for result in results]
+        )
+
+    def write_schemes(self, schemes):
+        self.writer.write_schemes(schemes)
+
+    def close(self):
+        self.writer.close()
+        with open(self.refs_path, "w") as f:
+            json.dump(self.normalizer.refs(), f, indent=4)
+
+
+class DeltaWriter:
+    """
+    Change data capture output (--diff)
+    Marks are compared with a previous run, its output or a state file, indexed by
+    enrollment + schemeID + subject code. Only the changes are written, one NDJSON
+    line per subject:
+        {"op": "insert", "enrollment", "schemeID", "subject", "marks"}
+        {"op": "update", ..., "marks", "previous"}
+    The first line of a student that isn't in the index also carries the rest of
+    the record under "student". A last {"op": "unchanged", "count"} line counts
+    the subjects that didn't change, nothing is ever deleted. Schemes are written
+    in full. With state_path, the index updated with this run is saved as the
+    state file for the next one (NDJSON of enrollment, schemeID and subjects)
+    """
+
+    streaming = True
+    # The deltas depend on the records before them, they're made in the parent
+    encodes_lines = False
+
+    def __init__(
+        self,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        previous_path: str = None,
+        state_path: str = None,
+    ):
+        self.index = {} if previous_path is None else self.load_index(previous_path)
+        self.state_path = state_path
+        self.writer = NDJSONWriter(result_path, scheme_path)
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    @staticmethod
+    def load_index(path: str) -> dict:
+        # (enrollment, schemeID) -> {subject code: marks} of a JSON, NDJSON or state
+        # file
+        index = {}
+        for record in read_records(path):
+            if isinstance(record, dict) and "op" in record:
+                raise ValueError(
+                    f"{path} is a delta output, pass the --state file or a full "
+                    "output instead"
+                )
+            if not isinstance(record, dict) or any(
+                field not in record for field in ("enrollment", "schemeID", "subjects")
+            ):
+                raise ValueError(f"{path} isn't a result output or a state file")
+            key = (record["enrollment"], record["schemeID"])
+            subjects = index.setdefault(key, {})
+            for code, marks in record["subjects"].items():
+                subjects[sys.intern(code)] = marks
+        return index
+
+    @property
+    def result_count(self):
+        return self.writer.result_count
+
+    @property
+    def scheme_count(self):
+        return self.writer.scheme_count
+
+    def write_results(self, results):
+        deltas = []
+        for record in results:
+            key = (record["enrollment"], record["schemeID"])
+            known = self.index.get(key)
+            student = None
+            if known is None:
+                known = self.index[key] = {}
+                student = {
+                    field: value
+                    for field, value in record.items()
+                    if field != "subjects"
+                }
+            for code, marks in record["subjects"].items():
+                previous = known.get(code)
+                if previous == marks:
+                    self.unchanged += 1
+                    continue
+                delta = {
+                    "op": "insert" if previous is None else "update",
+                    "enrollment": record["enrollment"],
+                    "schemeID": record["schemeID"],
+                    "subject": code,
+                    "marks": marks,
+                }
+                if previous is None:
+                    self.inserted += 1
+                else:
+                    delta["previous"] = previous
+                    self.updated += 1
+                if student is not None:
+                    delta["student"] = student
+                    student = None
+                known[sys.intern(code)] = marks
+                deltas.append(delta)
+        self.writer.write_results(deltas)
+
+    def write_schemes(self, schemes):
+        self.writer.write_schemes(schemes)
+
+    def close(self):
+        self.writer.write_lines(
+            NDJSONWriter.encode([{"op": "unchanged", "count": self.unchanged}]), 0
+        )
+        self.writer.close()
+        log.info(
+            "Delta: %d inserted, %d updated, %d unchanged",
+            self.inserted,
+            self.updated,
+            self.unchanged,
+        )
+        if self.state_path is not None:
+            # Written next to the state file and renamed, it may be the previous one
+            tmp = f"{self.state_path}.tmp"
+            with open(tmp, "w") as f:
+                for (enrollment, scheme_id), subjects in self.index.items():
+                    f.write(
+                        json.dumps(
+                            {
+                                "enrollment": enrollment,
+                                "schemeID": scheme_id,
+                                "subjects": subjects,
+                            }
+                        )
+                        + "\n"
+                    )
+            os.replace(tmp, self.state_path)
+
+
+def open_writer(
+    output_format: str = "json",
+    result_path: str = RESULT_PATH,
+    scheme_path: str = SCHEME_PATH,
+    normalize: bool = False,
+    diff: str = None,
+    state: str = None,
+    lookup_index: bool = False,
+):
+    """
+    Output writer for output_format, normalized output writes the result headers
+    and institutes next to result_path (result.refs.json for result.txt)
+    diff (a previous output or state file) or state switch to the NDJSON delta
+    output of DeltaWriter, whatever the output_format
+    lookup_index writes an EnrollmentIndex next to an NDJSON result output
+    """
+    if diff is not None or state is not None:
+        if normalize:
+            raise ValueError("The delta output can't be normalized")
+        return DeltaWriter(result_path, scheme_path, diff, state)
+    if lookup_index:
+        if output_format != "ndjson":
+            raise ValueError("The enrollment index needs the ndjson format")
+        writer = NDJSONWriter(
+            result_path, scheme_path, EnrollmentIndex.sidecar_path(result_path)
+        )
+    else:
+        writer = WRITERS[output_format](result_path, scheme_path)
+    if normalize:
+        if not isinstance(writer, (JSONWriter, NDJSONWriter)):
+            writer.close()
+            raise ValueError(
+                f"{output_format} output is already flat, it can't be normalized"
+            )
+        writer = NormalizedWriter(
+            writer, os.path.splitext(result_path)[0] + ".refs.json"
+        )
+    return writer
+
+
+def report_output(
+    writer, repeatedSchemeCount: int, repeatedLabel: str = "Repeated Scheme Count"
+):
+    log.info("Length Student Jsons: %d", writer.result_count)
+    log.info("Length Scheme Jsons: %d", writer.scheme_count)
+    log.info("%s: %d", repeatedLabel, repeatedSchemeCount)
+
+
+def read_records(path: str):
+    """
+    Yields the records of a JSON or NDJSON output file (JSONWriter or NDJSONWriter),
+    NDJSON is read line by line
+    """
+    with open(path) as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_scheme(schemes: dict, scheme: dict) -> bool:
+    """
+    Merges a parsed scheme page into schemes (keyed by schemeID)
+    A repeated schemeID adds its institute (once) and its subjects to the existing entry
+    Returns True if the scheme was a repeat
+    """
+    existing = schemes.get(scheme["schemeID"])
+    if existing is None:
+        schemes[scheme["schemeID"]] = scheme
+        return False
+
+    for institute in scheme["institutes"]:
+        if institute not in existing["institutes"]:
+            existing["institutes"].append(institute)
+    # Still append the subjects
+    existing.update({"subjects": {**existing["subjects"], **scheme["subjects"]}})
+    return True
+
+
+def merge_schemes(schemes: dict, partial) -> int:
+    """
+    Reduce step for scheme maps built from separate runs of pages (worker chunks, files)
+    Merges every scheme of partial into schemes with merge_scheme semantics and
+    returns the number of repeats, merging the partials in page order gives
+    the same schemes and repeatedSchemeCount as a single pass over all pages
+    """
+    return sum(merge_scheme(schemes, scheme) for scheme in partial)
+
+
+GRADE_POINTS = {"O": 10, "A+": 9, "A": 8, "B+": 7, "B": 6, "C": 5, "P": 4, "F": 0}
+
+
+class CreditSummary:
+    """
+    Per student credits and SGPA from the result and scheme outputs
+    Every mark is joined to its subject's credits on (schemeID, subjectCode) through a
+    hash index of the schemes, then grade points, credits and SGPA are summed for all
+    the students at once with NumPy instead of record by record
+    JSON and NDJSON outputs are flattened once, the columnar tables (CSV, Parquet,
+    Arrow) are read as they are. Grades outside GRADE_POINTS and subjects missing
+    from the schemes count as ungraded and stay out of the credits and the SGPA
+    """
+
+    STUDENT_COLUMNS = ["enrollment", "schemeID", "instCode", "sem", "batch"]
+
+    @staticmethod
+    def read_table(path: str, columns: dict):
+        # A ColumnarWriter table as a DataFrame, None for JSON and NDJSON outputs
+        import pandas as pd
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".parquet":
+            return pd.read_parquet(path)
+        if extension in (".arrow", ".feather"):
+            return pd.read_feather(path)
+        if extension == ".csv":
+            return pd.read_csv(
+                path,
+                dtype={name: str for name, kind in columns.items() if kind == "string"},
+            )
+        return None
+
+    @classmethod
+    def credits(cls, scheme_paths):
+        """
+        Credits of every scheme subject, indexed on (schemeID, subjectCode)
+        A subject repeated across the outputs keeps its last credits, as in merge_scheme
+        """
+        import pandas as pd
+
+        frames = []
+        for path in scheme_paths:
+            table = cls.read_table(path, ColumnarWriter.SCHEME_COLUMNS)
+            if table is None:
+                table = pd.DataFrame(
+                    [
+                        (scheme["schemeID"], subjectCode, as_int(subject["credits"]))
+                        for scheme in read_records(path)
+                        for subjectCode, subject in scheme["subjects"].items()
+                    ],
+                    columns=["schemeID", "subjectCode", "credits"],
+                )
+            frames.append(table[["schemeID", "subjectCode", "credits"]])
+        credits = pd.concat(frames, ignore_index=True).drop_duplicates(
+            ["schemeID", "subjectCode"], keep="last"
+        )
+        return credits.set_index(["schemeID", "subjectCode"])["credits"].astype(
+            "float64"
+        )
+
+    @classmethod
+    def marks(cls, result_paths):
+        """
+        (students, marks), one row per student and one per (student, subject)
+        marks["student"] is the student's row in students. Every JSON record is a
+        student, the rows of a columnar table are grouped by STUDENT_COLUMNS
+        """
+        import numpy as np
+        import pandas as pd
+
+        students = []
+        tables = []
+        offset = 0
+        for path in result_paths:
+            table = cls.read_table(path, ColumnarWriter.RESULT_COLUMNS)
+            if table is None:
+                rows = []
+                subjectCounts = []
+                subjectCodes = []
+                grades = []
+                for record in read_records(path):
+                    if "headerID" in record:
+                        raise ValueError(
+                            f"{path} is normalized, summarize the plain output instead"
+                        )
+                    subjects = record["subjects"]
+                    subjectCounts.append(len(subjects))
+                    subjectCodes.extend(subjects)
+                    grades.extend([marks["totalGrade"] for marks in subjects.values()])
+                    rows.append(
+                        (
+                            record["enrollment"],
+                            record["schemeID"],
+                            as_int(record["institute"].get("instCode")),
+                            as_int(record.get("resultHeader", {}).get("sem")),
+                            record["batch"],
+                        )
+                    )
+                keys = pd.DataFrame(rows, columns=cls.STUDENT_COLUMNS)
+                student = np.repeat(np.arange(len(rows), dtype=np.int64), subjectCounts)
+                table = pd.DataFrame(
+                    {
+                        "student": student,
+                        "schemeID": keys["schemeID"].to_numpy()[student],
+                        "subjectCode": subjectCodes,
+                        "grade": grades,
+                    }
+                )
+            else:
+                grouped = table.groupby(cls.STUDENT_COLUMNS, sort=False, dropna=False)
+                # ngroup without sorting numbers the students in order of appearance
+                keys = table[cls.STUDENT_COLUMNS].drop_duplicates()
+                table = table[["schemeID", "subjectCode", "grade"]].assign(
+                    student=grouped.ngroup().to_numpy()
+                )
+            table["student"] += offset
+            offset += len(keys)
+            students.append(keys)
+            tables.append(table)
+
+        if not students:
+            return pd.DataFrame(columns=cls.STUDENT_COLUMNS), pd.DataFrame(
+                columns=["student", "schemeID", "subjectCode", "grade"]
+            )
+        return (
+            pd.concat(students, ignore_index=True),
+            pd.concat(tables, ignore_index=True),
+        )
+
+    @classmethod
+    def summarize(cls, students, marks, credits):
+        """
+        Adds subjects, failed, ungraded, credits, creditsEarned, creditPoints and
+        sgpa to students. Failed (F) subjects count in the credits and not in
+        creditsEarned, sgpa is creditPoints / credits rounded to 2 places
+        """
+        import numpy as np
+
+        count = len(students)
+        student = marks["student"].to_numpy(dtype=np.int64)
+        subjectCredits = marks.join(credits, on=["schemeID", "subjectCode"])[
+            "credits"
+        ].to_numpy()
+        points = marks["grade"].map(GRADE_POINTS).to_numpy(dtype="float64")
+        graded = ~(np.isnan(points) | np.isnan(subjectCredits))
+        subjectCredits = np.where(graded, subjectCredits, 0.0)
+        points = np.where(graded, points, 0.0)
+
+        def per_student(weights=None):
+            return np.bincount(student, weights=weights, minlength=count)
+
+        totalCredits = per_student(subjectCredits)
+        creditPoints = per_student(subjectCredits * points)
+        summary = students.reset_index(drop=True).assign(
+            subjects=per_student(),
+            failed=per_student(graded & (points == 0)).astype(np.int64),
+            ungraded=per_student(~graded).astype(np.int64),
+            credits=totalCredits.astype(np.int64),
+            creditsEarned=per_student(np.where(points > 0, subjectCredits, 0.0)).astype(
+                np.int64
+            ),
+            creditPoints=creditPoints.astype(np.int64),
+            sgpa=np.divide(
+                creditPoints,
+                totalCredits,
+                out=np.full(count, np.nan),
+                where=totalCredits > 0,
+            ).round(2),
+        )
+        return summary.astype({"instCode": "Int32", "sem": "Int16"})
+
+    @staticmethod
+    def write(summary, path: str, output_format: str = "json"):
+        # json and ndjson write a missing SGPA (no graded credits) as null
+        if output_format in ("parquet", "arrow"):
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                log.warning(
+                    "pyarrow is not installed, writing CSV instead of %s", output_format
                 )
-                console.print(
-                    "Repeated Scheme Count: " + str(final_repeatedSchemeCount) + "\n\n"
+                output_format = "csv"
+                path = os.path.splitext(path)[0] + ".csv"
+        if output_format == "json":
+            summary.to_json(path, orient="records", indent=4)
+        elif output_format == "ndjson":
+            summary.to_json(path, orient="records", lines=True)
+        elif output_format == "csv":
+            summary.to_csv(path, index=False)
+        elif output_format == "parquet":
+            summary.to_parquet(path, index=False)
+        elif output_format == "arrow":
+            summary.to_feather(path)
+        else:
+            raise ValueError(f"Unknown summary format {output_format}")
+
+
+def select_pages(pdf, pages=None):
+    """
+    pages is None for every page, a (first, last) tuple of 1-based inclusive
+    page numbers, or an iterable of 1-based page numbers
+    """
+    if pages is None:
+        return pdf.pages
+    if isinstance(pages, tuple) and len(pages) == 2:
+        first, last = pages
+        return pdf.pages[first - 1 : last]
+    return [pdf.pages[page_number - 1] for page_number in pages]
+
+
+def section_start(
+    pdf, page_number: int, index: PageIndex = None, text: PdfiumText = None
+) -> int:
+    """
+    First page at or after page_number that starts a section, a scheme page that
+    follows a non-scheme page. A section (its scheme pages and the result pages
+    after them) is never split, page 1 starts the first one. Returns
+    len(pdf.pages) + 1 when no section starts at or after page_number
+    Pages are classified from page_number - 1 on until a start is found, a page
+    index answers without reading them
+    """
+    page_count = len(pdf.pages)
+    if page_number <= 1:
+        return 1
+    if page_number > page_count:
+        return page_count + 1
+
+    def is_scheme(number):
+        ptype = None if index is None else index.page_type(number)
+        if ptype is None:
+            ctx = PageContext(pdf.pages[number - 1], text_backend=text)
+            ptype = PageType(ctx).ptype
+            ctx.flush()
+        return ptype == enumPageType.SCHEME
+
+    previous = is_scheme(page_number - 1)
+    for number in range(page_number, page_count + 1):
+        current = is_scheme(number)
+        if current and not previous:
+            return number
+        previous = current
+    return page_count + 1
+
+
+def shard_pages(
+    pdf_path: str,
+    pages=None,
+    shard=None,
+    index: PageIndex = None,
+    text_backend: str = "pdfplumber",
+) -> range:
+    """
+    Pages to parse for a page range or a shard, pages is a (first, last) tuple of
+    1-based inclusive page numbers, shard an (i, n) tuple for the i-th (1-based) of
+    n equal page ranges. Either one takes the whole sections that start in its
+    range (see section_start), so adjacent ranges and the n shards of a PDF
+    cover every page exactly once, with no section split across them
+    """
+    with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+        page_count = len(pdf.pages)
+        if shard is not None:
+            i, n = shard
+            pages = ((i - 1) * page_count // n + 1, i * page_count // n)
+        first, last = pages or (1, page_count)
+        return range(
+            section_start(pdf, max(first, 1), index, text),
+            section_start(pdf, min(last, page_count) + 1, index, text),
+        )
+
+
+# Chunk bounds for the multiprocess parser, 100 pages per chunk used to be the
+# fixed size
+MAX_CHUNK = 100
+MIN_CHUNK = 4
+
+
+# Relative cost of parsing a page by type, used to balance chunks with a page index
+PAGE_COST = {
+    enumPageType.RESULT: 1.0,
+    enumPageType.SCHEME: 0.5,
+    enumPageType.UNKNOWN: 0.1,
+}
+
+
+def plan_chunks(
+    page_numbers,
+    workers: int,
+    max_chunk: int = MAX_CHUNK,
+    min_chunk: int = MIN_CHUNK,
+    index: "PageIndex" = None,
+    backlog: float = 0.0,
+):
+    """
+    Splits page_numbers into chunks that shrink towards the end of the run
+    Every chunk takes remaining / (2 * workers) pages, clamped to
+    [min_chunk, max_chunk], big chunks keep the per-task overhead low at the start
+    and the small ones at the end keep every worker busy until the last page
+
+    With a page index, pages are weighed by PAGE_COST instead of counted,
+    and a chunk that is at least half full ends early where the layout changes,
+    so each chunk mostly sees one table layout
+
+    backlog is the cost of the work queued after these pages (other files in batch mode)
+    """
+    page_numbers = list(page_numbers)
+
+    def cost(page_number):
+        if index is None:
+            return 1.0
+        return PAGE_COST.get(index.page_type(page_number), 1.0)
+
+    def target(remaining):
+        return max(min_chunk, min(max_chunk, (remaining + backlog) / (2 * workers)))
+
+    remaining = sum(map(cost, page_numbers))
+    chunks = []
+    chunk = []
+    chunk_cost = 0.0
+    chunk_target = target(remaining)
+    for page_number in page_numbers:
+        if chunk and (
+            chunk_cost >= chunk_target
+            or (
+                index is not None
+                and chunk_cost >= chunk_target / 2
+                and index.layout(page_number) != index.layout(chunk[-1])
+            )
+        ):
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            chunk, chunk_cost = [], 0.0
+            chunk_target = target(remaining)
+        chunk.append(page_number)
+        chunk_cost += cost(page_number)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+# State of a multiprocess parser worker, see ParserSenpai.init_worker
+_worker = {}
+
+# PDFs a worker keeps open at a time in batch mode
+WORKER_OPEN_PDFS = 4
+
+
+def worker_pdf(pdf_path: str):
+    # Workers open a PDF once and keep the last few they parsed open
+    pdfs = _worker["pdfs"]
+    if pdf_path not in pdfs:
+        if len(pdfs) >= WORKER_OPEN_PDFS:
+            evicted = next(iter(pdfs))
+            pdfs.pop(evicted).close()
+            texts = _worker["texts"]
+            if evicted in texts:
+                texts.pop(evicted).close()
+        pdfs[pdf_path] = open_pdf(pdf_path)
+    return pdfs[pdf_path]
+
+
+def worker_text(pdf_path: str, text_backend: str = "pdfplumber"):
+    # Text backend of a PDF the worker has open (see worker_pdf), None for pdfplumber
+    if TEXT_BACKENDS[text_backend] is None:
+        return None
+    texts = _worker["texts"]
+    if pdf_path not in texts:
+        texts[pdf_path] = open_text_backend(pdf_path, text_backend)
+    return texts[pdf_path]
+
+
+def rss_bytes() -> int:
+    # Resident set size of this process, from /proc on Linux, the peak so far elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _pool_worker(conn, initializer, initargs, max_rss, max_pages):
+    # WorkerPool worker loop, retires (exits) after the task that crosses a limit
+    if initializer is not None:
+        initializer(*initargs)
+    pages = 0
+    peak = rss_bytes()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        func, task, task_pages = message
+        before = rss_bytes()
+        try:
+            result = func(task)
+        except Exception as e:
+            try:
+                conn.send(("error", e, None))
+            except Exception:
+                # Exceptions that can't be pickled are sent as their repr
+                conn.send(("error", RuntimeError(repr(e)), None))
+            continue
+        rss = rss_bytes()
+        pages += task_pages
+        peak = max(peak, rss)
+        retire = bool(
+            (max_pages and pages >= max_pages) or (max_rss and rss >= max_rss)
+        )
+        stats = {"pages": pages, "rss": rss, "before": before, "peak": peak}
+        conn.send(("done", result, stats | {"retire": retire}))
+        if retire:
+            return
+
+
+class WorkerPool:
+    """
+    Process pool that bounds the memory of its workers (--max-worker-rss)
+    A worker is recycled, i.e. exits and is replaced by a fresh one, after the task
+    that takes it past max_pages pages or max_rss bytes of RSS. Workers report their
+    RSS after every task, the pool keeps the per page growth it observes, and
+    chunk_limit() sizes the next chunk to what the worker it goes to has left.
+    Every worker's pages and peak RSS are kept in stats, also for recycled ones
+    A worker that dies in a task (e.g. killed for its memory) is replaced, and
+    the task retried once. Tasks are pulled from the iterable only when a worker
+    is free, so the chunks can be sized as the run goes
+    imap_unordered may run in several threads at once (e.g. the jobs of a server),
+    the calls take free workers as they have tasks for them
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        initializer=None,
+        initargs=(),
+        max_rss: int = None,
+        max_pages: int = None,
+        task_pages=None,
+    ):
+        self.context = multiprocessing.get_context()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_rss = max_rss
+        self.max_pages = max_pages
+        # Pages of a task, runs in the parent
+        self.task_pages = task_pages or (lambda task: 1)
+        self.workers = {}
+        self.idle = []
+        self.lock = threading.Lock()
+        self.freed = threading.Condition(self.lock)
+        # The worker the calling thread's next task goes to, for chunk_limit
+        self.local = threading.local()
+        self.callers = 0
+        self.stats = {}
+        self.recycled = 0
+        self.baseline = None
+        self.page_bytes = 0.0
+        for _ in range(processes):
+            self._release(self._start())
+
+    def _start(self):
+        conn, child = self.context.Pipe()
+        process = self.context.Process(
+            target=_pool_worker,
+            args=(child, self.initializer, self.initargs, self.max_rss, self.max_pages),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        with self.lock:
+            self.workers[conn] = {
+                "process": process,
+                "pages": 0,
+                "rss": 0,
+                "task": None,
+            }
+            self.stats[process.pid] = {"pages": 0, "chunks": 0, "peakRss": 0}
+        return conn
+
+    def _stop(self, conn):
+        with self.lock:
+            worker = self.workers.pop(conn)
+        conn.close()
+        worker["process"].join()
+
+    def _replace(self, conn):
+        # A fresh worker in place of a retired or dead one
+        self._stop(conn)
+        with self.lock:
+            self.recycled += 1
+        return self._start()
+
+    def _acquire(self, block: bool):
+        # A free worker, None if there's none and block is False
+        with self.freed:
+            while block and not self.idle:
+                self.freed.wait()
+            return self.idle.pop() if self.idle else None
+
+    def _release(self, conn):
+        with self.freed:
+            self.idle.append(conn)
+            self.freed.notify()
+
+    def chunk_limit(self):
+        """
+        Pages the worker the next task goes to can take before it reaches
+        max_pages or, at the per page growth seen so far, max_rss. None for no limit
+        """
+        worker = self.workers.get(getattr(self.local, "next_worker", None))
+        if worker is None:
+            return None
+        limits = []
+        if self.max_pages:
+            limits.append(self.max_pages - worker["pages"])
+        if self.max_rss and self.page_bytes > 0:
+            rss = worker["rss"] or self.baseline or 0
+            limits.append(int((self.max_rss - rss) / self.page_bytes))
+        return max(1, min(limits)) if limits else None
+
+    def _observe(self, worker, stats, task_pages):
+        worker["pages"] = stats["pages"]
+        worker["rss"] = stats["rss"]
+        pid = worker["process"].pid
+        with self.lock:
+            self.stats[pid] = {
+                "pages": stats["pages"],
+                "chunks": self.stats[pid]["chunks"] + 1,
+                "peakRss": stats["peak"],
+            }
+            if self.baseline is None:
+                self.baseline = stats["before"]
+            # Moving average of the growth per page, a chunk that shrank counts as none
+            growth = max(0, stats["rss"] - stats["before"]) / max(1, task_pages)
+            self.page_bytes = (
+                growth if not self.page_bytes else (self.page_bytes + growth) / 2
+            )
+
+    def _finish(self, conn, stats):
+        # Back to the free workers after a task, through a fresh one if it retired
+        if stats is None or stats["retire"]:
+            conn = self._replace(conn)
+        self._release(conn)
+
+    def _drain(self, busy):
+        # Waits out the tasks still running for a call that stopped early
+        for conn in busy:
+            try:
+                _, _, stats = conn.recv()
+            except (EOFError, OSError):
+                stats = None
+            self._finish(conn, stats)
+
+    def imap_unordered(self, func, tasks):
+        tasks = iter(tasks)
+        busy = set()
+        exhausted = False
+
+        def dispatch(conn, task=None, attempts=0):
+            if task is None:
+                self.local.next_worker = conn
+                task = next(tasks, None)
+                if task is None:
+                    return False
+            task_pages = self.task_pages(task)
+            self.workers[conn]["task"] = (task, task_pages, attempts)
+            conn.send((func, task, task_pages))
+            busy.add(conn)
+            return True
+
+        with self.lock:
+            self.callers += 1
+        try:
+            while True:
+                # Every free worker gets a task, wait for one only when none is ours
+                while not exhausted:
+                    conn = self._acquire(block=not busy)
+                    if conn is None:
+                        break
+                    if not dispatch(conn):
+                        exhausted = True
+                        self._release(conn)
+                if not busy:
+                    return
+                sentinels = {
+                    self.workers[conn]["process"].sentinel: conn for conn in busy
+                }
+                # Other calls free workers too, look for them now and then
+                timeout = 0.05 if self.callers > 1 and not exhausted else None
+                for ready in wait([*busy, *sentinels], timeout):
+                    conn = sentinels.get(ready, ready)
+                    if conn not in busy:
+                        continue
+                    worker = self.workers[conn]
+                    task, task_pages, attempts = worker["task"]
+                    try:
+                        status, result, stats = conn.recv()
+                    except EOFError:
+                        # The worker died in the task
+                        busy.discard(conn)
+                        code = worker["process"].exitcode
+                        conn = self._replace(conn)
+                        if attempts:
+                            self._release(conn)
+                            raise RuntimeError(
+                                f"Pool worker exited with code {code} twice on a task"
+                            )
+                        log.warning(
+                            "Pool worker exited with code %s, retrying its task", code
+                        )
+                        dispatch(conn, task, attempts + 1)
+                        continue
+                    busy.discard(conn)
+                    if status == "error":
+                        self._release(conn)
+                        raise result
+                    self._observe(worker, stats, task_pages)
+                    self._finish(conn, stats)
+                    yield result
+        except (Exception, GeneratorExit):
+            # Hand the workers of the tasks in flight back to the pool, a shared pool
+            # outlives the call
+            self._drain(busy)
+            raise
+        finally:
+            with self.lock:
+                self.callers -= 1
+
+    def close(self):
+        for conn in list(self.workers):
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            self._stop(conn)
+
+    def terminate(self):
+        for conn, worker in list(self.workers.items()):
+            worker["process"].terminate()
+            self._stop(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+
+    def report(self, metrics: Metrics = NULL_METRICS):
+        # Pages and peak RSS of every worker the pool ran, recycled ones included
+        for pid, stats in self.stats.items():
+            if stats["chunks"]:
+                log.info(
+                    "Worker %d: %d pages in %d chunks, peak RSS %.1f MB",
+                    pid,
+                    stats["pages"],
+                    stats["chunks"],
+                    stats["peakRss"] / 2**20,
+                )
+            metrics.gauge("workerPeakRssBytes", stats["peakRss"])
+        if self.recycled:
+            log.info("Recycled workers: %d", self.recycled)
+        metrics.count("workersRecycled", self.recycled)
+
+
+class Parser:
+    def __init__(
+        self,
+        pages,
+        table_templates: bool = True,
+        tables: TableTemplates = None,
+        index: PageIndex = None,
+        cache: PageCache = None,
+        metrics: Metrics = None,
+        typed_marks: bool = False,
+        text_backend: PdfiumText = None,
+    ):
+        self.pages = pages
+        # Table grids learned on this run, shared by all pages of the run
+        if tables is None and table_templates:
+            tables = TableTemplates()
+        self.tables = tables
+        self.index = index
+        self.cache = cache
+        self.metrics = metrics or NULL_METRICS
+        # Integer marks with ABS/CAN flags, see PTResult.typed_marks
+        self.typed_marks = typed_marks
+        # Text of the pages' classification and headers, see PageContext
+        self.text_backend = text_backend
+        self.first_result_date = None
+
+    def fallback_date(self, page_number: int):
+        """
+        Result date for pages whose own one can't be parsed, the first valid one
+        before the page. Taken from the page index when there is one, which doesn't
+        depend on how the pages are split, otherwise from the pages seen in this run
+        """
+        if self.index is not None:
+            return self.index.result_date_before(page_number)
+        return self.first_result_date
+
+    @property
+    def cache_parts(self):
+        # Options that change a page's parse are part of its cache key
+        parts = ("typedMarks",) if self.typed_marks else ()
+        if self.text_backend is not None:
+            parts += (self.text_backend.name,)
+        return parts
+
+    def iter_pages(self, stdout_result: bool = False, kinds=None):
+        """
+        Parses self.pages one at a time, yielding (page_number, page type, parsed)
+        parsed is the list of student records of a result page, the scheme (not yet
+        merged with its repeats) of a scheme page and None for anything else
+        kinds limits the page types that are parsed, other pages are only classified
+        """
+        metrics = self.metrics
+        for page in self.pages:
+            fallback_date = self.fallback_date(page.page_number)
+
+            key = None
+            if self.cache is not None:
+                with metrics.time("cache"):
+                    key = self.cache.key(page, *self.cache_parts)
+                    entry = self.cache.get(key)
+                # A page that fell back to another page's result date only hits
+                # if the fallback is still the same
+                if entry is not None and entry.get("fallbackDate", "") not in (
+                    "",
+                    fallback_date and fallback_date.isoformat(),
+                ):
+                    entry = None
+                metrics.count("cacheMisses" if entry is None else "cacheHits")
+                if entry is not None:
+                    # Cache hit, the page is never classified or extracted
+                    ptype = enumPageType(entry["type"])
+                    if self.first_result_date is None and entry["resultDate"]:
+                        self.first_result_date = datetime.fromisoformat(
+                            entry["resultDate"]
+                        )
+                    parsed = entry["parsed"]
+                    if ptype == enumPageType.RESULT and stdout_result:
+                        for result in parsed:
+                            echo(result, end="\r")
+                    if ptype == enumPageType.RESULT:
+                        metrics.count("students", len(parsed))
+                    metrics.end_page(page.page_number, ptype)
+                    yield page.page_number, ptype, parsed
+                    continue
+
+            # One extraction context per page, shared by classification and parsing
+            ctx = PageContext(
+                page, self.tables, fallback_date, metrics, self.text_backend
+            )
+            with metrics.time("classify"):
+                ptype = PageType(ctx).ptype
+            resultDate = None
+            entry = {"type": str(ptype)}
+            if ptype == enumPageType.RESULT:
+                resultDate = PTResult(ctx).get_result_date()
+                if self.first_result_date is None:
+                    self.first_result_date = resultDate
+                if PTResult(ctx).uses_fallback_date():
+                    entry["fallbackDate"] = fallback_date and fallback_date.isoformat()
+            entry["resultDate"] = resultDate and resultDate.isoformat()
+            parsed = None
+            if kinds is None or ptype in kinds:
+                if ptype == enumPageType.SCHEME:
+                    with metrics.time("parseScheme"):
+                        parsed = PTScheme(ctx).parse_scheme_table()
+                elif ptype == enumPageType.RESULT:
+                    with metrics.time("parseResult"):
+                        parsed = PTResult(ctx).parse_result_table_to_json(
+                            stdout=stdout_result, typed=self.typed_marks
+                        )
+                    metrics.count("students", len(parsed))
+                if key is not None:
+                    with metrics.time("cache"):
+                        self.cache.put(key, entry | {"parsed": parsed})
+            ctx.flush()
+            metrics.end_page(page.page_number, ptype)
+            yield page.page_number, ptype, parsed
+
+    def parse(
+        self,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        stdout_scheme: bool = False,
+        stdout_result: bool = False,
+        write_to_file: bool = True,
+        output_format: str = "json",
+        writer=None,
+        normalize: bool = False,
+        progress=None,
+        diff: str = None,
+        state: str = None,
+        lookup_index: bool = False,
+    ):
+        """
+        Parses self.pages into (schemes, studentResults, repeatedSchemeCount)
+        With write_to_file, the output is written in output_format to result_path
+        and scheme_path (normalized with normalize). An explicit writer receives
+        the output instead, and is left open for the caller. Records handed to a
+        streaming writer are not kept, the returned studentResults is empty then
+        progress is an optional rich Progress to report the pages on
+        diff and state write the changes since a previous run instead, see DeltaWriter
+        lookup_index also writes an EnrollmentIndex of the NDJSON result output
+        """
+        owns_writer = writer is None and write_to_file
+        if owns_writer:
+            writer = open_writer(
+                output_format,
+                result_path,
+                scheme_path,
+                normalize,
+                diff,
+                state,
+                lookup_index,
+            )
+        keep_results = writer is None or not writer.streaming
+
+        schemes = dict()
+        studentResults = []
+        repeatedSchemeCount = 0
+        task = None
+        if progress is not None:
+            task = progress.add_task("Parsing", total=len(self.pages))
+        with progress if progress is not None else nullcontext():
+            for page_number, ptype, parsed in self.iter_pages(stdout_result):
+                if ptype == enumPageType.SCHEME:
+                    if merge_scheme(schemes, parsed):
+                        repeatedSchemeCount += 1
+                        if stdout_scheme:
+                            echo("Repeated Scheme: ", parsed["schemeID"])
+                            echo(schemes[parsed["schemeID"]])
+                elif ptype == enumPageType.RESULT:
+                    if writer is not None:
+                        with self.metrics.time("write"):
+                            writer.write_results(parsed)
+                    if keep_results:
+                        studentResults.extend(parsed)
+                else:
+                    log.debug("Unknown Page Type: %s (page %d)", ptype, page_number)
+
+                if task is not None:
+                    progress.update(
+                        task,
+                        advance=1,
+                        description=f"[bold blue]Paring Page:[/] {page_number}",
+                    )
+
+        if task is not None:
+            progress.update(task, completed=True, visible=False)
+
+        # Schemes are final only once every page has been seen
+        if writer is not None:
+            with self.metrics.time("write"):
+                writer.write_schemes(list(schemes.values()))
+
+        if owns_writer:
+            with self.metrics.time("write"):
+                writer.close()
+            report_output(writer, repeatedSchemeCount)
+
+        return list(schemes.values()), studentResults, repeatedSchemeCount
+
+    @staticmethod
+    def parse_chunk(task):
+        """
+        Multiprocess worker task, parses one chunk of pages of the worker's PDF
+        Returns (chunk index, (schemes, results, result count, repeatedSchemeCount,
+        metrics)), results are pre-encoded lines when the parent's writer takes them,
+        metrics is the chunk's Metrics.to_dict() when profiling and None otherwise
+        """
+        (
+            index,
+            pdf_path,
+            page_numbers,
+            stdout_scheme,
+            stdout_result,
+            encode,
+            profile,
+            typed_marks,
+            text_backend,
+        ) = task
+        metrics = Metrics() if profile else NULL_METRICS
+        pdf = worker_pdf(pdf_path)
+        parser = Parser(
+            [pdf.pages[page_number - 1] for page_number in page_numbers],
+            tables=_worker["tables"],
+            index=_worker["indexes"].get(pdf_path),
+            cache=_worker["cache"],
+            metrics=metrics,
+            typed_marks=typed_marks,
+            text_backend=worker_text(pdf_path, text_backend),
+        )
+
+        schemes = dict()
+        studentResults = []
+        repeatedSchemeCount = 0
+        for _, ptype, parsed in parser.iter_pages(stdout_result):
+            if ptype == enumPageType.SCHEME:
+                if merge_scheme(schemes, parsed):
+                    repeatedSchemeCount += 1
+                    if stdout_scheme:
+                        echo("Repeated Scheme: ", parsed["schemeID"])
+                        echo(schemes[parsed["schemeID"]])
+            elif ptype == enumPageType.RESULT:
+                studentResults.extend(parsed)
+
+        count = len(studentResults)
+        if encode:
+            with metrics.time("serialize"):
+                studentResults = NDJSONWriter.encode(studentResults)
+        return index, (
+            list(schemes.values()),
+            studentResults,
+            count,
+            repeatedSchemeCount,
+            metrics.to_dict() if profile else None,
+        )
+
+
+class ParserSenpai:
+    @staticmethod
+    def init_worker(
+        table_templates: bool = True,
+        indexes: dict = None,
+        cache: PageCache = None,
+    ):
+        # Every worker opens each PDF once, and keeps its learned table grids across
+        # chunks
+        _worker["pdfs"] = {}
+        _worker["texts"] = {}
+        _worker["tables"] = TableTemplates() if table_templates else None
+        _worker["indexes"] = indexes or {}
+        _worker["cache"] = cache
+
+    @staticmethod
+    def parallel_parser(
+        jobs,
+        writer=None,
+        stdout_result: bool = False,
+        stdout_scheme: bool = False,
+        table_templates: bool = True,
+        workers: int = None,
+        cache: PageCache = None,
+        metrics: Metrics = None,
+        typed_marks: bool = False,
+        pool=None,
+        max_worker_rss: int = None,
+        max_worker_pages: int = None,
+        text_backend: str = "pdfplumber",
+    ):
+        """
+        Parses jobs, a list of (pdf_path, PageIndex or None) or (pdf_path, PageIndex or
+        None, page numbers) for part of a PDF, on one worker pool
+        Every PDF is split into (pdf, chunk of pages) tasks that the workers pull as
+        they free up, the output is written and returned in job and page order, with
+        the schemes merged across all jobs. The workers' metrics are merged into
+        metrics
+        pool is an already running pool started with init_worker (e.g. the warm
+        WorkerPool of a server), its workers don't have the jobs' page indexes, so the
+        indexes only plan the chunks then
+        Otherwise the run gets a WorkerPool, whose workers are recycled after
+        max_worker_pages pages or max_worker_rss bytes of RSS, with the planned chunks
+        cut down to what the next worker has left
+        """
+        metrics = metrics or NULL_METRICS
+        keep_results = writer is None or not writer.streaming
+        # Let the workers encode the output lines when nobody needs the records back
+        encode = not keep_results and getattr(writer, "encodes_lines", False)
+        workers = max(1, workers or os.cpu_count() or 1)
+        final_result = []
+        final_scheme = dict()
+        final_repeatedSchemeCount = 0
+
+        def consume(payload):
+            nonlocal final_repeatedSchemeCount
+            schemes, results, count, repeatedSchemeCount, chunk_metrics = payload
+            if chunk_metrics is not None:
+                metrics.merge(chunk_metrics)
+            if writer is not None:
+                with metrics.time("write"):
+                    if encode:
+                        writer.write_lines(results, count)
+                    else:
+                        writer.write_results(results)
+            if keep_results:
+                final_result.extend(results)
+            # Chunks only merged their own scheme pages, reduce them by schemeID
+            final_repeatedSchemeCount += repeatedSchemeCount + merge_schemes(
+                final_scheme, schemes
+            )
+
+        planned = []
+        for pdf_path, index, *pages in jobs:
+            if pages and pages[0] is not None:
+                page_numbers = pages[0]
+            else:
+                with open_pdf(pdf_path) as pdf:
+                    page_numbers = range(1, len(pdf.pages) + 1)
+            if index is not None:
+                # Pages the prescan couldn't classify have nothing to parse
+                page_numbers = [
+                    page_number
+                    for page_number in page_numbers
+                    if index.page_type(page_number) != enumPageType.UNKNOWN
+                ]
+            planned.append((pdf_path, page_numbers, index))
+
+        # Chunks shrink towards the end of the whole batch, not of every file
+        chunks = []
+        backlog = sum(len(page_numbers) for _, page_numbers, _ in planned)
+        for pdf_path, page_numbers, index in planned:
+            backlog -= len(page_numbers)
+            for chunk in plan_chunks(
+                page_numbers, workers, index=index, backlog=backlog
+            ):
+                chunks.append((pdf_path, chunk))
+
+        def tasks():
+            # Numbered as they are handed out, a chunk the worker has no room for
+            # is split and its pages go out as consecutive tasks
+            task_number = 0
+            for pdf_path, chunk in chunks:
+                while chunk:
+                    limit = pool.chunk_limit() if isinstance(pool, WorkerPool) else None
+                    part, chunk = (
+                        (chunk[:limit], chunk[limit:]) if limit else (chunk, [])
+                    )
+                    yield (
+                        task_number,
+                        pdf_path,
+                        part,
+                        stdout_scheme,
+                        stdout_result,
+                        encode,
+                        metrics.enabled,
+                        typed_marks,
+                        text_backend,
+                    )
+                    task_number += 1
+
+        indexes = {job[0]: job[1] for job in jobs if job[1] is not None}
+        # A pool that was given is shared, its workers aren't this run's to report
+        own_pool = pool is None
+        with (
+            WorkerPool(
+                processes=max(1, min(workers, len(chunks))),
+                initializer=ParserSenpai.init_worker,
+                initargs=(table_templates, indexes, cache),
+                max_rss=max_worker_rss,
+                max_pages=max_worker_pages,
+                task_pages=lambda task: len(task[2]),
+            )
+            if pool is None
+            else nullcontext(pool)
+        ) as pool:
+            # Chunks finish in any order, hold them back until the earlier ones are in
+            # so the output stays in page order
+            done = {}
+            next_task = 0
+            for task_number, payload in pool.imap_unordered(
+                Parser.parse_chunk, tasks()
+            ):
+                done[task_number] = payload
+                while next_task in done:
+                    consume(done.pop(next_task))
+                    next_task += 1
+            if own_pool:
+                pool.report(metrics)
+
+        return list(final_scheme.values()), final_result, final_repeatedSchemeCount
+
+    @staticmethod
+    def multiprocessing_parser(
+        pdf_path: str = PDF_PATH,
+        stdout_result: bool = False,
+        stdout_scheme: bool = False,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        write_to_file: bool = True,
+        table_templates: bool = True,
+        output_format: str = "json",
+        workers: int = None,
+        index: PageIndex = None,
+        cache: PageCache = None,
+        normalize: bool = False,
+        metrics: Metrics = None,
+        typed_marks: bool = False,
+        pages=None,
+        max_worker_rss: int = None,
+        max_worker_pages: int = None,
+        text_backend: str = "pdfplumber",
+        diff: str = None,
+        state: str = None,
+        lookup_index: bool = False,
+    ):
+        # pages is an optional iterable of 1-based page numbers, e.g. a shard_pages
+        # range
+        writer = (
+            open_writer(
+                output_format,
+                result_path,
+                scheme_path,
+                normalize,
+                diff,
+                state,
+                lookup_index,
+            )
+            if write_to_file
+            else None
+        )
+        schemes, results, repeatedSchemeCount = ParserSenpai.parallel_parser(
+            [(pdf_path, index, pages)],
+            writer,
+            stdout_result=stdout_result,
+            stdout_scheme=stdout_scheme,
+            table_templates=table_templates,
+            workers=workers,
+            cache=cache,
+            metrics=metrics,
+            typed_marks=typed_marks,
+            max_worker_rss=max_worker_rss,
+            max_worker_pages=max_worker_pages,
+            text_backend=text_backend,
+        )
+        if writer is not None:
+            with (metrics or NULL_METRICS).time("write"):
+                writer.write_schemes(schemes)
+                writer.close()
+            report_output(writer, repeatedSchemeCount)
+        return schemes, results, repeatedSchemeCount
+
+    @staticmethod
+    def batch_parser(
+        pdf_paths,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        write_to_file: bool = True,
+        table_templates: bool = True,
+        output_format: str = "json",
+        workers: int = None,
+        index: bool = False,
+        cache: PageCache = None,
+        normalize: bool = False,
+        metrics: Metrics = None,
+        typed_marks: bool = False,
+        max_worker_rss: int = None,
+        max_worker_pages: int = None,
+        text_backend: str = "pdfplumber",
+        diff: str = None,
+        state: str = None,
+        lookup_index: bool = False,
+    ):
+        """
+        Batch mode, parses many PDFs (paths or glob patterns) on one shared worker pool
+        into one consolidated output, schemes are merged across all the files
+        With index, every PDF gets its page index sidecar built or reused first
+        """
+        paths = []
+        for pattern in pdf_paths:
+            matches = (
+                sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            )
+            paths.extend(path for path in matches if path not in paths)
+        log.info("Parsing %d pdfs", len(paths))
+
+        jobs = [
+            (
+                path,
+                PageIndex.load_or_build(
+                    path, workers=workers or 1, text_backend=text_backend
                 )
-                # for _, value in schemes.items():
-                #     f.write(json.dumps(value, indent=4) + "\n\n")
-                f.write(json.dumps(final_scheme, indent=4))
+                if index
+                else None,
+            )
+            for path in paths
+        ]
+        writer = (
+            open_writer(
+                output_format,
+                result_path,
+                scheme_path,
+                normalize,
+                diff,
+                state,
+                lookup_index,
+            )
+            if write_to_file
+            else None
+        )
+        schemes, results, repeatedSchemeCount = ParserSenpai.parallel_parser(
+            jobs,
+            writer,
+            table_templates=table_templates,
+            workers=workers,
+            cache=cache,
+            metrics=metrics,
+            typed_marks=typed_marks,
+            max_worker_rss=max_worker_rss,
+            max_worker_pages=max_worker_pages,
+            text_backend=text_backend,
+        )
+        if writer is not None:
+            with (metrics or NULL_METRICS).time("write"):
+                writer.write_schemes(schemes)
+                writer.close()
+            report_output(writer, repeatedSchemeCount)
+        return schemes, results, repeatedSchemeCount
+
+    @staticmethod
+    def merge_outputs(
+        result_paths,
+        scheme_paths,
+        result_path: str = RESULT_PATH,
+        scheme_path: str = SCHEME_PATH,
+        output_format: str = "json",
+        normalize: bool = False,
+        batch_size: int = 1000,
+    ):
+        """
+        Merges the outputs of separate parses (e.g. the shards of one PDF, see
+        shard_pages) into one. Results are concatenated in the given order, schemes
+        are merged by schemeID the way Parser.parse merges scheme pages. The outputs
+        are JSON or NDJSON, written without normalize, the merged output can be
+        written in any format and normalized
+        Returns (schemes, repeatedSchemeCount), the count only covers scheme pages
+        repeated across the outputs
+        """
+        writer = open_writer(output_format, result_path, scheme_path, normalize)
+        try:
+            for path in result_paths:
+                batch = []
+                for record in read_records(path):
+                    if "headerID" in record:
+                        raise ValueError(
+                            f"{path} is normalized, merge the plain outputs instead"
+                        )
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        writer.write_results(batch)
+                        batch = []
+                writer.write_results(batch)
+
+            schemes = dict()
+            repeatedSchemeCount = sum(
+                merge_schemes(schemes, read_records(path)) for path in scheme_paths
+            )
+            writer.write_schemes(list(schemes.values()))
+        finally:
+            writer.close()
+        # Repeats within a shard were merged by its own parse, only the ones
+        # across shards are counted here
+        report_output(writer, repeatedSchemeCount, "Cross-shard Repeated Schemes")
+        return list(schemes.values()), repeatedSchemeCount
+
+    @staticmethod
+    def summarize_outputs(
+        result_paths,
+        scheme_paths,
+        summary_path: str = "summary.json",
+        output_format: str = "json",
+    ):
+        """
+        Writes every student's credits, credits earned and SGPA (see CreditSummary)
+        The outputs are JSON, NDJSON or columnar tables, written without normalize
+        Returns the summary DataFrame
+        """
+        start = perf_counter()
+        students, marks = CreditSummary.marks(result_paths)
+        summary = CreditSummary.summarize(
+            students, marks, CreditSummary.credits(scheme_paths)
+        )
+        CreditSummary.write(summary, summary_path, output_format)
+        log.info("Summarized %d students (%d marks)", len(summary), len(marks))
+        log.info("Ungraded marks: %d", int(summary["ungraded"].sum()))
+        log.info("Summary time: %.2f s", perf_counter() - start)
+        return summary
+
+    """
+        Generator API
+        Records are yielded as their pages are parsed, so the caller controls memory
+        and can overlap the parse with its own I/O. pages is an optional page range,
+        see select_pages
+    """
+
+    @staticmethod
+    def iter_parse(
+        pdf_path: str = PDF_PATH,
+        pages=None,
+        table_templates: bool = True,
+        typed_marks: bool = False,
+        text_backend: str = "pdfplumber",
+    ):
+        # Yields ("result", record) page by page, then ("scheme", scheme) for every
+        # merged scheme
+        schemes = dict()
+        with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+            for _, ptype, parsed in Parser(
+                select_pages(pdf, pages),
+                table_templates,
+                typed_marks=typed_marks,
+                text_backend=text,
+            ).iter_pages():
+                if ptype == enumPageType.SCHEME:
+                    merge_scheme(schemes, parsed)
+                elif ptype == enumPageType.RESULT:
+                    for record in parsed:
+                        yield "result", record
+        for scheme in schemes.values():
+            yield "scheme", scheme
+
+    @staticmethod
+    def iter_results(
+        pdf_path: str = PDF_PATH,
+        pages=None,
+        table_templates: bool = True,
+        typed_marks: bool = False,
+        text_backend: str = "pdfplumber",
+    ):
+        # Scheme pages are only classified, their tables are never extracted
+        with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+            for _, _, parsed in Parser(
+                select_pages(pdf, pages),
+                table_templates,
+                typed_marks=typed_marks,
+                text_backend=text,
+            ).iter_pages(kinds=(enumPageType.RESULT,)):
+                if parsed:
+                    yield from parsed
 
-        return final_scheme, final_result, final_repeatedSchemeCount
+    @staticmethod
+    def iter_schemes(
+        pdf_path: str = PDF_PATH,
+        pages=None,
+        table_templates: bool = True,
+        text_backend: str = "pdfplumber",
+    ):
+        # Schemes are final only after the last page, result pages are only classified
+        schemes = dict()
+        with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+            for _, _, parsed in Parser(
+                select_pages(pdf, pages), table_templates, text_backend=text
+            ).iter_pages(kinds=(enumPageType.SCHEME,)):
+                if parsed:
+                    merge_scheme(schemes, parsed)
+        yield from schemes.values()
 
     """
         Single Process Parser
@@ -756,6 +3845,11 @@ class ParserSenpai:
         If stdout_scheme or stdout_result is True, the parsed data will be printed to the console
         If write_to_file is False, the parsed data will be returned as a tuple (scheme, result),
         and result_path and scheme_path will be ignored
+        pages limits the parse to a page range (see select_pages and shard_pages)
+        text_backend picks the text of the page classification and headers, see
+        TEXT_BACKENDS
+        diff and state write only the changes since a previous run, see DeltaWriter
+        lookup_index writes an EnrollmentIndex next to an NDJSON result output
     """
 
     @staticmethod
@@ -767,49 +3861,58 @@ class ParserSenpai:
         scheme_path: str = SCHEME_PATH,
         write_to_file: bool = False,
         offset: int = 0,
+        table_templates: bool = True,
+        output_format: str = "json",
+        index: PageIndex = None,
+        cache: PageCache = None,
+        normalize: bool = False,
+        metrics: Metrics = None,
+        progress=None,
+        typed_marks: bool = False,
+        pages=None,
+        text_backend: str = "pdfplumber",
+        diff: str = None,
+        state: str = None,
+        lookup_index: bool = False,
     ):
 
-        console.print(f"Parsing [bold blue]{pdf_path}[/]")
-
-        with pdfplumber.open(pdf_path) as pdf:
-            return Parser(pdf.pages[offset:]).parse(
+        log.info("Parsing %s", pdf_path)
+
+        with open_pdf(pdf_path) as pdf, open_text(pdf_path, text_backend) as text:
+            return Parser(
+                select_pages(pdf, pages)[offset:],
+                table_templates,
+                index=index,
+                cache=cache,
+                metrics=metrics,
+                typed_marks=typed_marks,
+                text_backend=text,
+            ).parse(
                 result_path=result_path,
                 scheme_path=scheme_path,
                 stdout_scheme=stdout_scheme,
                 stdout_result=stdout_result,
                 write_to_file=write_to_file,
+                output_format=output_format,
+                normalize=normalize,
+                progress=progress,
+                diff=diff,
+                state=state,
+                lookup_index=lookup_index,
             )
 
 
-if __name__ == "__main__":
-    from time import time
-
-    try:
-        start = time()
-        args = parser.parse_args()
-
-        if args.single_process:
-            ParserSenpai.single_process_parser(
-                args.input,
-                args.stdout_scheme,
-                args.stdout_result,
-                args.output_result,
-                args.output_scheme,
-                write_to_file=True,
-                offset=0,
-            )
+def main(argv=None):
+    # Deprecated alias, the CLI lives in ParserSenpaiCLI (the parsersenpai script)
+    warnings.warn(
+        "ParserSenpai.main is deprecated, run ParserSenpaiCLI.py or parsersenpai",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    from ParserSenpaiCLI import main as cli_main
 
-        if args.multi_process:
-            ParserSenpai.multiprocessing_parser(
-                args.input,
-                args.stdout_result,
-                args.stdout_scheme,
-                args.output_result,
-                args.output_scheme,
-                write_to_file=True,
-            )
+    return cli_main(argv)
 
-        print("Time Elapsed: ", time() - start)
 
-    except KeyboardInterrupt:
-        print("Keyboard Interrupt")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,781 @@
+"""
+    ParserSenpai command line interface
+    - Kept apart from the parser, so importing ParserSenpai doesn't build the argument
+      parser, a console or a progress bar
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from time import time
+
+from rich.console import Console
+from rich.logging import RichHandler
+from rich.progress import Progress
+
+from ParserSenpai import (
+    PDF_PATH,
+    RESULT_PATH,
+    SCHEME_PATH,
+    EnrollmentIndex,
+    Metrics,
+    PageCache,
+    TEXT_BACKENDS,
+    PageIndex,
+    ParserSenpai,
+    shard_pages,
+)
+
+
+def page_range(value: str):
+    # "A-B" (1-based, inclusive), "A-" runs to the last page
+    first, sep, last = value.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last else sys.maxsize
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a page range A-B, got {value}")
+    if not sep or first < 1 or last < first:
+        raise argparse.ArgumentTypeError(f"Expected a page range A-B, got {value}")
+    return first, last
+
+
+def positive_int(value: str):
+    # Worker counts and limits, 0 or less would leave nothing to run the parse
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a positive integer, got {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Expected a positive integer, got {value}")
+    return number
+
+
+def shard(value: str):
+    # "i/N", the i-th (1-based) of N shards
+    i, sep, n = value.partition("/")
+    try:
+        i, n = int(i), int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard i/N, got {value}")
+    if not sep or not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f"Expected a shard i/N, got {value}")
+    return i, n
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="IPU Results PDF Parser by martian0x80",
+        description="Parses the IPU results pdf to generate meaningful data for export "
+        "and data pipelines\nAuthor: martian0x80",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "-os",
+        "--output-scheme",
+        action="store",
+        dest="output_scheme",
+        default=SCHEME_PATH,
+        help="Output the scheme data here (txt)",
+    )
+
+    parser.add_argument(
+        "-or",
+        "--output-result",
+        action="store",
+        dest="output_result",
+        default=RESULT_PATH,
+        help="Output the result data here (txt)",
+    )
+
+    parser.add_argument(
+        "-ps",
+        "--print-scheme",
+        action="store_true",
+        dest="stdout_scheme",
+        default=False,
+    )
+    parser.add_argument(
+        "-pr",
+        "--print-result",
+        action="store_true",
+        dest="stdout_result",
+        default=False,
+    )
+
+    parser.add_argument(
+        "-mp",
+        "--multi-process",
+        action="store_true",
+        dest="multi_process",
+        default=False,
+    )
+
+    parser.add_argument(
+        "-sp",
+        "--single-process",
+        action="store_true",
+        dest="single_process",
+        default=False,
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        dest="output_format",
+        choices=["json", "ndjson", "parquet", "arrow", "csv", "sqlite"],
+        default="json",
+        help="Output format, ndjson streams one record per line as pages are parsed, "
+        "parquet, arrow and csv write long format tables of marks and scheme subjects, "
+        "sqlite upserts everything into the database at the result output path",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch",
+        action="store",
+        dest="batch",
+        nargs="+",
+        default=None,
+        help="Parse many pdfs (paths or glob patterns) on one shared worker pool into "
+        "one output",
+    )
+
+    parser.add_argument(
+        "-nz",
+        "--normalize",
+        action="store_true",
+        dest="normalize",
+        default=False,
+        help="Emit result headers and institutes once with IDs (in "
+        "<result>.refs.json), records reference them by ID",
+    )
+
+    parser.add_argument(
+        "-li",
+        "--lookup-index",
+        action="store_true",
+        dest="lookup_index",
+        default=False,
+        help="Also write an enrollment index of the ndjson result output "
+        "(<result>.idx), for the lookup command",
+    )
+
+    parser.add_argument(
+        "--diff",
+        action="store",
+        dest="diff",
+        default=None,
+        help="Previous output or state file to compare with, only the inserted and "
+        "updated marks (by enrollment, schemeID and subject) are written as NDJSON "
+        "deltas",
+    )
+
+    parser.add_argument(
+        "--state",
+        action="store",
+        dest="state",
+        default=None,
+        help="Save the marks known after this run to this state file, for the next "
+        "--diff",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store",
+        dest="profile",
+        nargs="?",
+        const="profile.json",
+        default=None,
+        help="Time every parse stage and count pages, students and fallbacks (across "
+        "workers), and write the summary JSON to this path",
+    )
+
+    parser.add_argument(
+        "--prometheus",
+        action="store",
+        dest="prometheus",
+        default=None,
+        help="Also write the profile metrics to this Prometheus textfile",
+    )
+
+    parser.add_argument(
+        "-tm",
+        "--typed-marks",
+        action="store_true",
+        dest="typed_marks",
+        default=False,
+        help="Emit marks as integers with absent/cancelled flags instead of the "
+        "cells' strings",
+    )
+
+    parser.add_argument(
+        "-tb",
+        "--text-backend",
+        action="store",
+        dest="text_backend",
+        choices=list(TEXT_BACKENDS),
+        default="pdfplumber",
+        help="Text of the page classification and headers, pdfium reads it natively "
+        "and leaves pdfplumber to the table extraction",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        action="store",
+        dest="workers",
+        type=positive_int,
+        default=os.cpu_count(),
+        help="Number of worker processes for the multi-process parser",
+    )
+
+    parser.add_argument(
+        "--max-worker-rss",
+        action="store",
+        dest="max_worker_rss",
+        type=positive_int,
+        default=None,
+        help="Recycle a worker once its RSS crosses this many MB, chunks are sized to "
+        "fit under it from the memory per page seen so far",
+    )
+
+    parser.add_argument(
+        "--max-worker-pages",
+        action="store",
+        dest="max_worker_pages",
+        type=positive_int,
+        default=None,
+        help="Recycle a worker after it parsed this many pages",
+    )
+
+    pages = parser.add_mutually_exclusive_group()
+    pages.add_argument(
+        "--pages",
+        action="store",
+        dest="pages",
+        type=page_range,
+        default=None,
+        help="Parse the sections (scheme pages and their result pages) that start in "
+        "pages A-B, adjacent ranges never split a section",
+    )
+    pages.add_argument(
+        "--shard",
+        action="store",
+        dest="shard",
+        type=shard,
+        default=None,
+        help="Parse shard i of N, the sections that start in the i-th of N equal page "
+        "ranges, combine the shards' outputs with the merge command",
+    )
+
+    parser.add_argument(
+        "-ix",
+        "--index",
+        action="store",
+        dest="index",
+        nargs="?",
+        const="",
+        default=None,
+        help="Prescan the pdf into a page index sidecar (default <input>.index.json) "
+        "and plan the parse with it, an up to date sidecar is reused",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        dest="cache_dir",
+        default=None,
+        help="Keep parsed pages in this directory, unchanged pages are not parsed "
+        "again on later runs",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        action="store",
+        dest="cache_size",
+        type=int,
+        default=1024,
+        help="Size limit of the page cache in MB, least recently used pages are "
+        "evicted",
+    )
+
+    parser.add_argument(
+        "-nt",
+        "--no-table-templates",
+        action="store_false",
+        dest="table_templates",
+        default=True,
+        help="Run the full table finder on every page instead of reusing learned table "
+        "grids and the subjects of repeated scheme pages",
+    )
+
+    parser.add_argument(
+        "-in",
+        "--input",
+        action="store",
+        dest="input",
+        help="Path to the pdf file",
+        default=PDF_PATH,
+    )
+
+    return parser
+
+
+def build_serve_parser():
+    parser = argparse.ArgumentParser(
+        prog="parsersenpai serve",
+        description="Keeps a warm pool of parser workers and takes parse jobs over "
+        "local HTTP or a Unix socket, records are streamed back as NDJSON",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument(
+        "--socket",
+        dest="socket_path",
+        default=None,
+        help="Listen on this Unix socket instead of host:port",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        default=os.cpu_count(),
+        help="Number of warm worker processes",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=16,
+        help="Jobs that may wait for a turn, more are turned away with 429",
+    )
+    parser.add_argument(
+        "--max-running",
+        type=int,
+        default=1,
+        help="Jobs that share the worker pool at a time",
+    )
+    parser.add_argument(
+        "--retain",
+        type=int,
+        default=64,
+        help="Finished jobs kept for their results, the oldest are forgotten first",
+    )
+    parser.add_argument(
+        "--retain-size",
+        type=int,
+        default=1024,
+        help="Size limit in MB of the records spooled by the kept jobs",
+    )
+    parser.add_argument(
+        "--retain-age",
+        type=int,
+        default=3600,
+        help="Seconds a finished job is kept",
+    )
+    parser.add_argument(
+        "--spool-dir",
+        default=None,
+        help="Spool the jobs' records here, the system temporary directory by default",
+    )
+    parser.add_argument(
+        "--max-worker-rss",
+        type=positive_int,
+        default=None,
+        help="Recycle a worker once its RSS crosses this many MB",
+    )
+    parser.add_argument(
+        "--max-worker-pages",
+        type=positive_int,
+        default=None,
+        help="Recycle a worker after this many pages",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep parsed pages in this directory (see the parse --cache-dir)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Size limit of the page cache in MB",
+    )
+    parser.add_argument(
+        "-nt",
+        "--no-table-templates",
+        action="store_false",
+        dest="table_templates",
+        help="Run the full table finder on every page",
+    )
+    return parser
+
+
+def build_merge_parser():
+    parser = argparse.ArgumentParser(
+        prog="parsersenpai merge",
+        description="Merges the JSON or NDJSON outputs of separate parses (e.g. the "
+        "--shard runs of one PDF) into one, schemes are merged by schemeID",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-r",
+        "--results",
+        nargs="+",
+        required=True,
+        help="Result outputs to merge, in page order",
+    )
+    parser.add_argument(
+        "-s",
+        "--schemes",
+        nargs="+",
+        required=True,
+        help="Scheme outputs to merge",
+    )
+    parser.add_argument(
+        "-os",
+        "--output-scheme",
+        dest="output_scheme",
+        default=SCHEME_PATH,
+        help="Output the merged scheme data here",
+    )
+    parser.add_argument(
+        "-or",
+        "--output-result",
+        dest="output_result",
+        default=RESULT_PATH,
+        help="Output the merged result data here",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=["json", "ndjson", "parquet", "arrow", "csv", "sqlite"],
+        default="json",
+        help="Format of the merged output",
+    )
+    parser.add_argument(
+        "-nz",
+        "--normalize",
+        action="store_true",
+        help="Normalize the merged output (see the parse --normalize)",
+    )
+    return parser
+
+
+def build_lookup_parser():
+    parser = argparse.ArgumentParser(
+        prog="parsersenpai lookup",
+        description="Looks students up by enrollment in an ndjson result output, "
+        "through its enrollment index (built first if it's missing or out of date)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("result", help="ndjson result output")
+    parser.add_argument("enrollments", nargs="+", help="Enrollment numbers")
+    parser.add_argument(
+        "--scheme-id", default=None, help="Only results of this schemeID"
+    )
+    parser.add_argument(
+        "--inst-code", type=int, default=None, help="Only results of this institute"
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="Index path, <result>.idx by default",
+    )
+    return parser
+
+
+def build_sgpa_parser():
+    parser = argparse.ArgumentParser(
+        prog="parsersenpai sgpa",
+        description="Summarizes every student's credits, credits earned and SGPA, "
+        "joining the result outputs' grades to the scheme outputs' credits",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-r",
+        "--results",
+        nargs="+",
+        required=True,
+        help="Result outputs (json, ndjson, or csv, parquet and arrow tables)",
+    )
+    parser.add_argument(
+        "-s",
+        "--schemes",
+        nargs="+",
+        required=True,
+        help="Scheme outputs of the same parses",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="summary.json",
+        help="Output the per student summary here",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=["json", "ndjson", "csv", "parquet", "arrow"],
+        default="json",
+        help="Format of the summary",
+    )
+    return parser
+
+
+def setup_console():
+    console = Console()
+    # The parser reports through the ParserSenpai logger
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        handlers=[RichHandler(console=console, show_time=False, show_path=False)],
+    )
+    return console
+
+
+def serve_main(argv):
+    args = build_serve_parser().parse_args(argv)
+    setup_console()
+
+    from ParserSenpaiServer import serve
+
+    serve(
+        args.host,
+        args.port,
+        args.socket_path,
+        workers=args.workers,
+        max_queue=args.max_queue,
+        max_running=args.max_running,
+        retain=args.retain,
+        retain_bytes=args.retain_size * 1024 * 1024,
+        retain_seconds=args.retain_age,
+        spool_dir=args.spool_dir,
+        table_templates=args.table_templates,
+        cache=PageCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        if args.cache_dir is not None
+        else None,
+        max_worker_rss=args.max_worker_rss * 1024 * 1024
+        if args.max_worker_rss is not None
+        else None,
+        max_worker_pages=args.max_worker_pages,
+    )
+
+
+def merge_main(argv):
+    parser = build_merge_parser()
+    args = parser.parse_args(argv)
+    setup_console()
+    if args.normalize and args.output_format not in ("json", "ndjson"):
+        parser.error("--normalize needs the json or ndjson format")
+    missing = [path for path in args.results + args.schemes if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"No such file {', '.join(missing)}")
+    try:
+        ParserSenpai.merge_outputs(
+            args.results,
+            args.schemes,
+            args.output_result,
+            args.output_scheme,
+            output_format=args.output_format,
+            normalize=args.normalize,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def lookup_main(argv):
+    parser = build_lookup_parser()
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.result):
+        parser.error(f"No such file {args.result}")
+    try:
+        index = EnrollmentIndex.open(args.result, args.index)
+    except ValueError as e:
+        parser.error(str(e))
+    # One JSON record per line on stdout, so it pipes into jq and the like
+    with index:
+        for enrollment in args.enrollments:
+            for record in index.lookup(enrollment, args.scheme_id, args.inst_code):
+                print(json.dumps(record))
+
+
+def sgpa_main(argv):
+    parser = build_sgpa_parser()
+    args = parser.parse_args(argv)
+    setup_console()
+    missing = [path for path in args.results + args.schemes if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"No such file {', '.join(missing)}")
+    try:
+        ParserSenpai.summarize_outputs(
+            args.results, args.schemes, args.output, args.output_format
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+
+# Subcommands, the first argument picks one, anything else is a parse
+COMMANDS = {
+    "serve": serve_main,
+    "merge": merge_main,
+    "lookup": lookup_main,
+    "sgpa": sgpa_main,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    console = setup_console()
+    parser = build_parser()
+    try:
+        start = time()
+        args = parser.parse_args(argv)
+        if args.normalize and args.output_format not in ("json", "ndjson"):
+            parser.error("--normalize needs the json or ndjson format")
+        if args.batch and (
+            args.single_process or args.multi_process or args.pages or args.shard
+        ):
+            parser.error("-b parses whole files, without -sp, -mp, --pages or --shard")
+        if (args.diff or args.state) and (
+            args.normalize or args.output_format not in ("json", "ndjson")
+        ):
+            parser.error("--diff and --state write NDJSON deltas, without --normalize")
+        if args.lookup_index and (
+            args.output_format != "ndjson" or args.diff or args.state
+        ):
+            parser.error("--lookup-index needs the ndjson format, without --diff")
+        if args.diff and not os.path.isfile(args.diff):
+            parser.error(f"No such file {args.diff}")
+
+        index = None
+        if args.index is not None and not args.batch:
+            index = PageIndex.load_or_build(
+                args.input,
+                args.index or None,
+                args.workers if args.multi_process else 1,
+                args.text_backend,
+            )
+            console.print(f"Page index: [bold blue]{len(index.entries)}[/] pages")
+
+        pages = None
+        if args.pages or args.shard:
+            pages = shard_pages(
+                args.input, args.pages, args.shard, index, args.text_backend
+            )
+            console.print(
+                f"Pages: [bold blue]{pages.start}-{pages.stop - 1}[/]"
+                if pages
+                else "Pages: [bold blue]none[/], no section starts in the range"
+            )
+
+        # Profiling is off unless asked for, the parsers then use the no-op NULL_METRICS
+        metrics = Metrics() if args.profile or args.prometheus else None
+
+        max_worker_rss = None
+        if args.max_worker_rss is not None:
+            max_worker_rss = args.max_worker_rss * 1024 * 1024
+
+        cache = None
+        if args.cache_dir is not None:
+            cache = PageCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+        if args.batch:
+            ParserSenpai.batch_parser(
+                args.batch,
+                args.output_result,
+                args.output_scheme,
+                write_to_file=True,
+                table_templates=args.table_templates,
+                output_format=args.output_format,
+                workers=args.workers,
+                index=args.index is not None,
+                cache=cache,
+                normalize=args.normalize,
+                metrics=metrics,
+                typed_marks=args.typed_marks,
+                max_worker_rss=max_worker_rss,
+                max_worker_pages=args.max_worker_pages,
+                text_backend=args.text_backend,
+                diff=args.diff,
+                state=args.state,
+                lookup_index=args.lookup_index,
+            )
+
+        if args.single_process:
+            ParserSenpai.single_process_parser(
+                args.input,
+                args.stdout_scheme,
+                args.stdout_result,
+                args.output_result,
+                args.output_scheme,
+                write_to_file=True,
+                offset=0,
+                table_templates=args.table_templates,
+                output_format=args.output_format,
+                index=index,
+                cache=cache,
+                normalize=args.normalize,
+                metrics=metrics,
+                progress=Progress(console=console),
+                typed_marks=args.typed_marks,
+                pages=pages,
+                text_backend=args.text_backend,
+                diff=args.diff,
+                state=args.state,
+                lookup_index=args.lookup_index,
+            )
+
+        if args.multi_process:
+            ParserSenpai.multiprocessing_parser(
+                args.input,
+                args.stdout_result,
+                args.stdout_scheme,
+                args.output_result,
+                args.output_scheme,
+                write_to_file=True,
+                table_templates=args.table_templates,
+                output_format=args.output_format,
+                workers=args.workers,
+                index=index,
+                cache=cache,
+                normalize=args.normalize,
+                metrics=metrics,
+                typed_marks=args.typed_marks,
+                pages=pages,
+                max_worker_rss=max_worker_rss,
+                max_worker_pages=args.max_worker_pages,
+                text_backend=args.text_backend,
+                diff=args.diff,
+                state=args.state,
+                lookup_index=args.lookup_index,
+            )
+
+        elapsed = time() - start
+        print("Time Elapsed: ", elapsed)
+
+        if metrics is not None:
+            if args.profile:
+                metrics.write_summary(args.profile, elapsed)
+                console.print(f"Profile written to [bold blue]{args.profile}[/]")
+            if args.prometheus:
+                metrics.write_prometheus(args.prometheus)
+
+    except ValueError as e:
+        # A --diff file that isn't a full output, an output option the writer refuses
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("Keyboard Interrupt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+    ParserSenpai server
+    - Keeps a warm pool of parser workers, so a job doesn't pay for the interpreter,
+      the imports or the pool start-up, and workers keep their learned table grids
+    - Takes parse jobs (a PDF path plus options) over local HTTP or a Unix socket
+    - Streams the student records back as NDJSON while the job runs
+
+    API:
+        POST /jobs                  {"pdf": path, "typedMarks": false} -> 202 job
+        POST /parse                 same body, streams the records of the new job
+        GET  /jobs/<id>             job status
+        GET  /jobs/<id>/results     NDJSON records, streamed as the pages are parsed
+        GET  /jobs/<id>/schemes     NDJSON merged schemes, once the job is done
+        GET  /status                workers, queue depth and running jobs
+
+    A full queue answers 429 with Retry-After, instead of queueing jobs without bound
+    Records are spooled to a temporary NDJSON file per job, not kept in memory, and
+    finished jobs are forgotten (their spool deleted) beyond a count, a total size
+    or an age
+"""
+
+import json
+import logging
+import os
+import queue
+import signal
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from time import time
+
+from ParserSenpai import NDJSONWriter, PageCache, ParserSenpai, WorkerPool
+
+log = logging.getLogger("ParserSenpai.server")
+
+
+class Job:
+    """
+    One parse job, also the streaming writer its parse writes to
+    Encoded record lines are appended to the job's spool file, readers follow
+    the file as it grows
+    """
+
+    streaming = True
+    encodes_lines = True
+
+    # Bytes a reader reads from the spool at a time
+    READ_SIZE = 1 << 20
+
+    def __init__(self, pdf_path: str, typed_marks: bool = False, spool_dir: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.pdf_path = pdf_path
+        self.typed_marks = typed_marks
+        self.status = "queued"
+        self.error = None
+        self.created = time()
+        self.started = None
+        self.finished = None
+        fd, self.spool_path = tempfile.mkstemp(
+            prefix=f"parsersenpai-{self.id}-", suffix=".ndjson", dir=spool_dir
+        )
+        self.spool = os.fdopen(fd, "wb")
+        self.size = 0
+        self.result_count = 0
+        self.scheme_count = 0
+        self.schemes = None
+        self.changed = threading.Condition()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "pdf": self.pdf_path,
+            "status": self.status,
+            "error": self.error,
+            "results": self.result_count,
+            "schemes": self.scheme_count,
+            "bytes": self.size,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def set_status(self, status: str, error: str = None):
+        with self.changed:
+            self.status = status
+            self.error = error
+            if status == "running":
+                self.started = time()
+            elif self.done:
+                self.finished = time()
+                self.spool.close()
+            self.changed.notify_all()
+
+    def write_results(self, results):
+        self.write_lines(NDJSONWriter.encode(results), len(results))
+
+    def write_lines(self, lines: str, count: int):
+        data = lines.encode()
+        with self.changed:
+            self.spool.write(data)
+            self.spool.flush()
+            self.size += len(data)
+            self.result_count += count
+            self.changed.notify_all()
+
+    def write_schemes(self, schemes):
+        with self.changed:
+            self.schemes = NDJSONWriter.encode(schemes).encode()
+            self.scheme_count = len(schemes)
+
+    def close(self):
+        pass
+
+    def follow(self):
+        """
+        Yields the spooled bytes written so far, then the new ones until the job is
+        done. The reader keeps its own handle, so a job forgotten while it's being
+        read still streams to the end
+        """
+        with open(self.spool_path, "rb") as f:
+            sent = 0
+            while True:
+                with self.changed:
+                    while sent == self.size and not self.done:
+                        self.changed.wait()
+                    size = self.size
+                    done = self.done
+                while sent < size:
+                    chunk = f.read(min(self.READ_SIZE, size - sent))
+                    sent += len(chunk)
+                    yield chunk
+                if done and sent == self.size:
+                    return
+
+    def wait(self):
+        with self.changed:
+            while not self.done:
+                self.changed.wait()
+
+    def discard(self):
+        # Deletes the spool of a finished job
+        try:
+            os.remove(self.spool_path)
+        except FileNotFoundError:
+            pass
+
+
+class ParserServer:
+    """
+    Warm worker pool plus a bounded job queue
+    max_running jobs share the pool at a time, the pool's workers pull the chunks
+    of all of them. At most max_queue more jobs wait. Finished jobs are forgotten,
+    oldest first, beyond retain jobs, retain_bytes of spooled records in all or
+    retain_seconds after they finished
+    The pool is a WorkerPool, a worker that dies in a chunk is replaced and the
+    chunk retried, and workers are recycled after max_worker_pages pages or
+    max_worker_rss bytes of RSS
+    """
+
+    # Seconds between retention checks of an idle server
+    TRIM_INTERVAL = 60
+
+    def __init__(
+        self,
+        workers: int = None,
+        max_queue: int = 16,
+        max_running: int = 1,
+        retain: int = 64,
+        retain_bytes: int = 1 << 30,
+        retain_seconds: float = 3600,
+        spool_dir: str = None,
+        table_templates: bool = True,
+        cache: PageCache = None,
+        max_worker_rss: int = None,
+        max_worker_pages: int = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_running = max_running
+        self.retain = retain
+        self.retain_bytes = retain_bytes
+        self.retain_seconds = retain_seconds
+        self.spool_dir = spool_dir
+        self.pool = WorkerPool(
+            processes=self.workers,
+            initializer=ParserSenpai.init_worker,
+            initargs=(table_templates, None, cache),
+            max_rss=max_worker_rss,
+            max_pages=max_worker_pages,
+            task_pages=lambda task: len(task[2]),
+        )
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.running = 0
+        for _ in range(max_running):
+            threading.Thread(target=self.run_jobs, daemon=True).start()
+
+    def submit(self, pdf_path: str, typed_marks: bool = False) -> Job:
+        # Raises queue.Full when the queue is at max_queue
+        job = Job(pdf_path, typed_marks, self.spool_dir)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            job.spool.close()
+            job.discard()
+            raise
+        with self.lock:
+            self.jobs[job.id] = job
+        self.trim()
+        return job
+
+    def trim(self):
+        # Forgets finished jobs, oldest first, until the job count, the spooled
+        # bytes and the ages are within bounds
+        with self.lock:
+            finished = sorted(
+                (job for job in self.jobs.values() if job.done),
+                key=lambda job: job.finished,
+            )
+            count = len(self.jobs)
+            size = sum(job.size for job in self.jobs.values())
+            now = time()
+            forgotten = []
+            for job in finished:
+                if (
+                    count <= self.retain
+                    and size <= self.retain_bytes
+                    and now - job.finished <= self.retain_seconds
+                ):
+                    break
+                del self.jobs[job.id]
+                count -= 1
+                size -= job.size
+                forgotten.append(job)
+        for job in forgotten:
+            job.discard()
+
+    def run_jobs(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=self.TRIM_INTERVAL)
+            except queue.Empty:
+                self.trim()
+                continue
+            with self.lock:
+                self.running += 1
+            job.set_status("running")
+            try:
+                schemes, _, _ = ParserSenpai.parallel_parser(
+                    [(job.pdf_path, None)],
+                    job,
+                    workers=self.workers,
+                    typed_marks=job.typed_marks,
+                    pool=self.pool,
+                )
+                job.write_schemes(schemes)
+                job.set_status("done")
+            except Exception as e:
+                log.exception("Job %s failed", job.id)
+                job.set_status("failed", f"{type(e).__name__}: {e}")
+            finally:
+                with self.lock:
+                    self.running -= 1
+                self.queue.task_done()
+                self.trim()
+
+    def status(self) -> dict:
+        with self.lock:
+            spooled = sum(job.size for job in self.jobs.values())
+        return {
+            "workers": self.workers,
+            "queueDepth": self.queue.qsize(),
+            "maxQueue": self.queue.maxsize,
+            "running": self.running,
+            "maxRunning": self.max_running,
+            "jobs": len(self.jobs),
+            "spooledBytes": spooled,
+            "recycledWorkers": self.pool.recycled,
+        }
+
+    def close(self):
+        self.pool.terminate()
+        with self.lock:
+            jobs = list(self.jobs.values())
+            self.jobs.clear()
+        for job in jobs:
+            if not job.spool.closed:
+                job.spool.close()
+            job.discard()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # Responses end by closing the connection, so records can be streamed as they come
+    protocol_version = "HTTP/1.0"
+
+    @property
+    def parser_server(self) -> ParserServer:
+        return self.server.parser_server
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        log.info("%s %s", self.address_string(), format % args)
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_lines(self, lines):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for chunk in lines:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, the job itself keeps running
+            pass
+
+    def find_job(self, id: str):
+        job = self.parser_server.jobs.get(id)
+        if job is None:
+            self.send_json(404, {"error": f"No job {id}"})
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["status"]:
+            return self.send_json(200, self.parser_server.status())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.find_job(parts[1])
+            if job is None:
+                return
+            if len(parts) == 2:
+                return self.send_json(200, job.to_dict())
+            if parts[2] == "results":
+                return self.send_lines(job.follow())
+            if parts[2] == "schemes":
+                job.wait()
+                return self.send_lines([job.schemes or b""])
+        self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/jobs", "/parse"):
+            return self.send_json(404, {"error": f"Unknown path {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            options = json.loads(self.rfile.read(length) or b"{}")
+            pdf_path = options["pdf"]
+        except (ValueError, KeyError, TypeError):
+            return self.send_json(400, {"error": 'Expected a JSON body {"pdf": path}'})
+        if not os.path.isfile(pdf_path):
+            return self.send_json(400, {"error": f"No such file {pdf_path}"})
+
+        try:
+            job = self.parser_server.submit(pdf_path, bool(options.get("typedMarks")))
+        except queue.Full:
+            # Backpressure, the client retries once the queue drains
+            return self.send_json(
+                429, self.parser_server.status(), headers={"Retry-After": "1"}
+            )
+
+        if self.path == "/parse":
+            return self.send_lines(job.follow())
+        self.send_json(
+            202,
+            job.to_dict() | {"queueDepth": self.parser_server.queue.qsize()},
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str = None,
+    **options,
+):
+    """
+    Runs the server until interrupted, on socket_path (a Unix socket) when given,
+    otherwise on host:port. options go to ParserServer
+    """
+    parser_server = ParserServer(**options)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        httpd = UnixHTTPServer(socket_path, RequestHandler)
+        address = socket_path
+    else:
+        httpd = ThreadingHTTPServer((host, port), RequestHandler)
+        address = f"http://{host}:{port}"
+    httpd.parser_server = parser_server
+    # Service managers stop it with SIGTERM, shut down the same as on Ctrl+C
+    signal.signal(
+        signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start()
+    )
+    log.info("Serving on %s with %d workers", address, parser_server.workers)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        parser_server.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,321 @@
+"""
+    Parser-Senpai benchmark harness
+    - Runs offline on a synthetic PDF (see synthpdf.py) or on a given PDF
+    - Times every stage of the parse separately: text extraction, classification,
+      table extraction, JSON building and serialization
+    - Reports pages/sec and peak RSS per stage, single process and on a worker pool
+
+    Usage:
+        python benchmarks/bench.py --pages 200 --layout mixed --workers 4
+        python benchmarks/bench.py --pdf RESULT_BTECH7_DEC2023.pdf --max-chunk 50
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+from multiprocessing import Pool
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfplumber
+from rich.console import Console
+from rich.table import Table
+
+import synthpdf
+from ParserSenpai import (
+    MAX_CHUNK,
+    TEXT_BACKENDS,
+    PageContext,
+    PageType,
+    PTResult,
+    PTScheme,
+    TableTemplates,
+    enumPageType,
+    open_text_backend,
+    plan_chunks,
+)
+
+STAGES = ["text", "classify", "table", "json", "serialize"]
+
+console = Console()
+
+# Per process state of the pool workers
+_bench = {}
+
+
+def rss_bytes():
+    # Current resident set size, from /proc on Linux, the peak so far elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def new_stats():
+    return {stage: {"seconds": 0.0, "pages": 0, "rss": 0} for stage in STAGES}
+
+
+def merge_stats(total, stats):
+    # Seconds and pages add up across workers, RSS is the largest worker's
+    for stage in STAGES:
+        total[stage]["seconds"] += stats[stage]["seconds"]
+        total[stage]["pages"] += stats[stage]["pages"]
+        total[stage]["rss"] = max(total[stage]["rss"], stats[stage]["rss"])
+    return total
+
+
+def is_repeated_scheme(scheme, tables):
+    # A scheme page parse_scheme_table takes from its fingerprint, without a table
+    if tables is None:
+        return False
+    header = scheme.get_scheme_header()
+    if header is None:
+        return False
+    key = tables.fingerprints.key(header["schemeID"], scheme.table_text())
+    return key in tables.fingerprints.entries
+
+
+def bench_pages(pages, tables=None, text=None):
+    """
+    Parses pages the way Parser.iter_pages does, one stage at a time
+    Every stage only does its own work, the earlier stages' results are cached on the
+    page's PageContext. A repeated scheme page only has its fingerprint looked up
+    in the table stage, as parse_scheme_table does. Returns the per stage seconds,
+    pages and peak RSS
+    """
+    stats = new_stats()
+
+    def timed(stage, start):
+        stats[stage]["seconds"] += perf_counter() - start
+        stats[stage]["pages"] += 1
+        stats[stage]["rss"] = max(stats[stage]["rss"], rss_bytes())
+
+    for page in pages:
+        ctx = PageContext(page, tables, text_backend=text)
+
+        start = perf_counter()
+        ctx.text
+        timed("text", start)
+
+        start = perf_counter()
+        ptype = PageType(ctx).ptype
+        timed("classify", start)
+
+        if ptype == enumPageType.SCHEME:
+            scheme = PTScheme(ctx)
+            start = perf_counter()
+            if not is_repeated_scheme(scheme, tables):
+                ctx.extract_table(validate=PTScheme.is_valid_table)
+            timed("table", start)
+
+            start = perf_counter()
+            parsed = scheme.parse_scheme_table()
+            timed("json", start)
+        elif ptype == enumPageType.RESULT:
+            start = perf_counter()
+            ctx.extract_table(PTResult.table_settings, validate=PTResult.is_valid_table)
+            timed("table", start)
+
+            start = perf_counter()
+            parsed = PTResult(ctx).parse_result_table_to_json()
+            timed("json", start)
+        else:
+            parsed = None
+
+        if parsed is not None:
+            start = perf_counter()
+            json.dumps(parsed)
+            timed("serialize", start)
+
+        ctx.flush()
+
+    return stats
+
+
+def init_worker(pdf_path, table_templates, text_backend):
+    _bench["pdf"] = pdfplumber.open(pdf_path)
+    _bench["tables"] = TableTemplates() if table_templates else None
+    _bench["text"] = open_text_backend(pdf_path, text_backend)
+
+
+def bench_chunk(page_numbers):
+    pdf = _bench["pdf"]
+    return bench_pages(
+        [pdf.pages[page_number - 1] for page_number in page_numbers],
+        _bench["tables"],
+        _bench["text"],
+    )
+
+
+def single_process(pdf_path, table_templates=True, text_backend="pdfplumber"):
+    start = perf_counter()
+    text = open_text_backend(pdf_path, text_backend)
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        stats = bench_pages(
+            pdf.pages, TableTemplates() if table_templates else None, text
+        )
+    if text is not None:
+        text.close()
+    return stats, page_count, perf_counter() - start
+
+
+def multi_process(
+    pdf_path,
+    workers,
+    max_chunk=MAX_CHUNK,
+    table_templates=True,
+    text_backend="pdfplumber",
+):
+    start = perf_counter()
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    chunks = plan_chunks(range(1, page_count + 1), workers, max_chunk)
+    stats = new_stats()
+    with Pool(
+        processes=min(workers, len(chunks)),
+        initializer=init_worker,
+        initargs=(pdf_path, table_templates, text_backend),
+    ) as pool:
+        for chunk_stats in pool.imap_unordered(bench_chunk, chunks):
+            merge_stats(stats, chunk_stats)
+    return stats, page_count, perf_counter() - start
+
+
+def report(title, stats, page_count, wall, workers=1):
+    """
+    Per stage pages/sec is per process, the pages a stage got through in its own
+    time (tables, JSON and serialization only count scheme and result pages)
+    """
+    table = Table(title=title)
+    table.add_column("Stage")
+    table.add_column("Pages", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Pages/sec", justify="right")
+    table.add_column("Peak RSS (MB)", justify="right")
+    for stage in STAGES:
+        seconds = stats[stage]["seconds"]
+        pages = stats[stage]["pages"]
+        table.add_row(
+            stage,
+            str(pages),
+            f"{seconds:.3f}",
+            f"{pages / seconds:.1f}" if seconds else "-",
+            f"{stats[stage]['rss'] / 2**20:.1f}",
+        )
+    table.add_row(
+        f"total ({workers} workers)" if workers > 1 else "total",
+        str(page_count),
+        f"{wall:.3f}",
+        f"{page_count / wall:.1f}",
+        f"{max(stats[stage]['rss'] for stage in STAGES) / 2**20:.1f}",
+        style="bold",
+    )
+    console.print(table)
+    return {
+        "mode": title,
+        "workers": workers,
+        "pages": page_count,
+        "seconds": wall,
+        "pagesPerSec": page_count / wall,
+        "stages": {
+            stage: {
+                **stats[stage],
+                "pagesPerSec": stats[stage]["pages"] / stats[stage]["seconds"]
+                if stats[stage]["seconds"]
+                else None,
+            }
+            for stage in STAGES
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser-Senpai benchmarks")
+    parser.add_argument("--pdf", help="Benchmark this PDF instead of a synthetic one")
+    parser.add_argument("-n", "--pages", type=int, default=100)
+    parser.add_argument(
+        "-l", "--layout", choices=["newer", "older", "mixed"], default="mixed"
+    )
+    parser.add_argument("-s", "--students-per-page", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-w", "--workers", type=int, default=os.cpu_count(), help="Pool size"
+    )
+    parser.add_argument("--max-chunk", type=int, default=MAX_CHUNK)
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=["single", "multi", "both"],
+        default="both",
+    )
+    parser.add_argument(
+        "-nt",
+        "--no-table-templates",
+        action="store_false",
+        dest="table_templates",
+    )
+    parser.add_argument(
+        "-tb", "--text-backend", choices=list(TEXT_BACKENDS), default="pdfplumber"
+    )
+    parser.add_argument(
+        "-o", "--output", help="Also write the numbers to this JSON file"
+    )
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    tmp = None
+    if pdf_path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp.close()
+        pdf_path = tmp.name
+        synthpdf.write_pdf(
+            pdf_path,
+            synthpdf.build_pages(
+                args.pages, args.layout, args.students_per_page, args.seed
+            ),
+        )
+        console.print(
+            f"Synthetic PDF: [bold blue]{args.pages}[/] pages, {args.layout} layout"
+        )
+
+    results = []
+    try:
+        if args.mode in ("single", "both"):
+            stats, page_count, wall = single_process(
+                pdf_path, args.table_templates, args.text_backend
+            )
+            results.append(report("single process", stats, page_count, wall))
+        if args.mode in ("multi", "both"):
+            stats, page_count, wall = multi_process(
+                pdf_path,
+                args.workers,
+                args.max_chunk,
+                args.table_templates,
+                args.text_backend,
+            )
+            results.append(
+                report("multi process", stats, page_count, wall, args.workers)
+            )
+    finally:
+        if tmp is not None:
+            os.remove(pdf_path)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+    Parser-Senpai server check
+    - Starts `parsersenpai serve` on a temporary Unix socket, offline, and parses a
+      synthetic PDF (see synthpdf.py) or a given PDF through it
+    - Checks that the streamed records and the job's schemes equal a local parse of
+      the same file, that a full queue answers 429 and that a bad PDF fails its job
+      without taking the server down. Exits with 1 on any failed check
+
+    Usage:
+        python benchmarks/server_check.py --pages 60 --layout mixed
+        python benchmarks/server_check.py --pdf RESULT_BTECH7_DEC2023.pdf -w 4
+"""
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rich.console import Console
+
+import synthpdf
+from ParserSenpai import ParserSenpai
+
+console = Console()
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=120):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(socket_path, method, path, body=None):
+    # (status, headers, body bytes) of one request, the server closes every connection
+    conn = UnixConnection(socket_path)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, dict(response.getheaders()), data
+
+
+def ndjson(data):
+    return [json.loads(line) for line in data.decode().splitlines() if line.strip()]
+
+
+def wait_for(socket_path, seconds=60):
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        if os.path.exists(socket_path):
+            try:
+                return request(socket_path, "GET", "/status")
+            except OSError:
+                pass
+        sleep(0.1)
+    raise TimeoutError(f"The server didn't come up on {socket_path}")
+
+
+def wait_job(socket_path, job_id, seconds=300):
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        _, _, data = request(socket_path, "GET", f"/jobs/{job_id}")
+        job = json.loads(data)
+        if job["status"] in ("done", "failed"):
+            return job
+        sleep(0.1)
+    raise TimeoutError(f"Job {job_id} didn't finish")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser-Senpai server check")
+    parser.add_argument("--pdf", help="Parse this PDF instead of a synthetic one")
+    parser.add_argument("-n", "--pages", type=int, default=60)
+    parser.add_argument(
+        "-l", "--layout", choices=["newer", "older", "mixed"], default="mixed"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Server workers")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="parsersenpai-check-")
+    socket_path = os.path.join(tmp, "server.sock")
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tmp, "synthetic.pdf")
+        synthpdf.write_pdf(
+            pdf_path, synthpdf.build_pages(args.pages, args.layout, seed=args.seed)
+        )
+    bad_path = os.path.join(tmp, "not-a.pdf")
+    with open(bad_path, "w") as f:
+        f.write("not a PDF\n")
+
+    console.print(f"Local parse of [bold blue]{pdf_path}[/]")
+    schemes, results, _ = ParserSenpai.single_process_parser(
+        pdf_path, write_to_file=False
+    )
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        mark = "[green]ok[/]" if ok else "[bold red]FAILED[/]"
+        console.print(f"{mark} {name} {detail}")
+        if not ok:
+            failures.append(name)
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "ParserSenpaiCLI.py"),
+            "serve",
+            "--socket",
+            socket_path,
+            "-w",
+            str(args.workers),
+            "--max-queue",
+            "1",
+            "--spool-dir",
+            tmp,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        status, _, _ = wait_for(socket_path)
+        check("status", status == 200)
+
+        # Streamed records of a new job
+        start = perf_counter()
+        status, _, data = request(socket_path, "POST", "/parse", {"pdf": pdf_path})
+        streamed = ndjson(data)
+        check(
+            "POST /parse records",
+            status == 200 and streamed == results,
+            f"{len(streamed)} of {len(results)} records in "
+            f"{perf_counter() - start:.2f}s",
+        )
+
+        # A job, then its records and schemes once it's done
+        status, headers, data = request(socket_path, "POST", "/jobs", {"pdf": pdf_path})
+        job = json.loads(data)
+        check(
+            "POST /jobs",
+            status == 202 and headers.get("Location") == f"/jobs/{job['id']}",
+        )
+        job = wait_job(socket_path, job["id"])
+        check("job done", job["status"] == "done", job["error"] or "")
+        _, _, data = request(socket_path, "GET", f"/jobs/{job['id']}/results")
+        check("GET results", ndjson(data) == results)
+        _, _, data = request(socket_path, "GET", f"/jobs/{job['id']}/schemes")
+        check("GET schemes", ndjson(data) == schemes, f"{len(schemes)} schemes")
+
+        # One job runs and one waits, the next ones are turned away
+        answers = [
+            request(socket_path, "POST", "/jobs", {"pdf": pdf_path}) for _ in range(4)
+        ]
+        rejected = [headers for status, headers, _ in answers if status == 429]
+        check(
+            "429 on a full queue",
+            bool(rejected) and all("Retry-After" in headers for headers in rejected),
+            f"{len(rejected)} of {len(answers)} turned away",
+        )
+        for status, _, data in answers:
+            if status == 202:
+                wait_job(socket_path, json.loads(data)["id"])
+
+        # A PDF that can't be parsed fails its job, the server keeps serving
+        status, _, data = request(socket_path, "POST", "/jobs", {"pdf": bad_path})
+        job = wait_job(socket_path, json.loads(data)["id"])
+        check("bad PDF fails its job", job["status"] == "failed", job["error"] or "")
+        status, _, data = request(socket_path, "POST", "/parse", {"pdf": pdf_path})
+        check("serving after a failed job", status == 200 and ndjson(data) == results)
+
+        _, _, data = request(socket_path, "GET", "/status")
+        console.print(json.loads(data))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            code = server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            code = None
+        check("SIGTERM shutdown", code == 0, f"exit code {code}")
+        check("socket removed", not os.path.exists(socket_path))
+        spools = [name for name in os.listdir(tmp) if name.endswith(".ndjson")]
+        check("spools removed", not spools, f"{len(spools)} left")
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+    if failures:
+        console.print(f"[bold red]{len(failures)}[/] checks failed")
+        sys.exit(1)
+    console.print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
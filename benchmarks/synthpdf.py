@@ -0,0 +1,290 @@
+"""
+    Synthetic GGSIPU result/scheme PDF generator for the benchmarks
+    - Scheme pages followed by result pages for every (programme, semester, institute)
+    - Both the newer and the older header layouts handled by PTScheme/PTResult
+    - Writes a dependency free PDF (base-14 Helvetica, ruled tables), so no real
+      result PDF is needed to benchmark offline
+"""
+
+import argparse
+import random
+import zlib
+
+PAGE_WIDTH = 842
+PAGE_HEIGHT = 595
+FONT_SIZE = 6
+
+PROGRAMMES = [
+    ("027", "BACHELOR OF TECHNOLOGY (COMPUTER SCIENCE AND ENGINEERING)"),
+    ("049", "BACHELOR OF TECHNOLOGY (ELECTRICAL & ELECTRONICS ENGINEERING)"),
+]
+INSTITUTES = [
+    ("115", "BHARATI VIDYAPEETH COLLEGE OF ENGINEERING"),
+    ("133", "HMR INSTITUTE OF TECHNOLOGY & MANAGEMENT"),
+    ("768", "GURU TEGH BAHADUR INSTITUTE OF TECHNOLOGY"),
+]
+SEMESTERS = {
+    "newer": ["FIRST SEMESTER", "THIRD SEMESTER", "FIFTH SEMESTER"],
+    "older": ["02 SEMESTER", "04 SEMESTER", "06 SEMESTER"],
+}
+GRADES = [(90, "O"), (75, "A+"), (65, "A"), (55, "B+"), (50, "B"), (45, "C"), (40, "P")]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class Canvas:
+    def __init__(self):
+        self.ops = []
+
+    def text(self, x, top, text, size=FONT_SIZE):
+        # pdfplumber measures from the top, PDF from the bottom
+        y = PAGE_HEIGHT - top - size
+        self.ops.append(f"BT /F1 {size} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET")
+
+    def lines(self, text, x, top, size=FONT_SIZE, leading=8):
+        for i, line in enumerate(text.split("\n")):
+            self.text(x, top + i * leading, line, size)
+
+    def rect(self, x0, top, x1, bottom):
+        y0 = PAGE_HEIGHT - bottom
+        self.ops.append(f"{x0:.2f} {y0:.2f} {x1 - x0:.2f} {bottom - top:.2f} re S")
+
+    def cell(self, x0, top, x1, bottom, text=None):
+        self.rect(x0, top, x1, bottom)
+        if text:
+            self.lines(text, x0 + 2, top + 2)
+
+    def stream(self):
+        return zlib.compress("\n".join(self.ops).encode("latin-1"))
+
+
+def _grade(total):
+    for cutoff, grade in GRADES:
+        if total >= cutoff:
+            return grade
+    return "F"
+
+
+def scheme_page(layout, prg, scheme_id, sem, inst, subjects):
+    c = Canvas()
+    if layout == "newer":
+        header = (
+            f"SCHEME OF EXAMINATIONS\n"
+            f"Prg. Code: {prg[0]}      Programme: {prg[1]}      SchemeID: {scheme_id}"
+            f"      Sem./Annual: {sem}\n"
+            f"Institution Code: {inst[0]}      Institution: {inst[1]}"
+        )
+    else:
+        header = (
+            f"(SCHEME OF EXAMINATIONS)\n"
+            f"Scheme of Programme Code: {prg[0]}     Programme Name: {prg[1]}"
+            f"      SchemeID: {scheme_id}     Sem./Year: {sem}\n"
+            f"Institution Code: {inst[0]}     Institution: {inst[1]}"
+        )
+    c.lines(header, 20, 20, leading=10)
+    columns = [
+        ("S. No.", 30), ("PaperID", 50), ("Paper Code", 50), ("Paper Name", 180),
+        ("Credit", 30), ("Type", 50), ("Exam", 40), ("Mode", 60), ("Kind", 60),
+        ("Minor", 35), ("Major", 35), ("Max. Marks", 45), ("Pass Marks", 45),
+    ]
+    top = 70
+    row_height = 14
+    rows = [[name for name, _ in columns]]
+    for i, (code, paper_id, name, credits) in enumerate(subjects, start=1):
+        rows.append(
+            [str(i), paper_id, code, name, str(credits), "THEORY", "UES",
+             "COMPULSORY", "MANDATORY", "25", "75", "100", "40"]
+        )
+    for row in rows:
+        x = 20
+        for (_, width), value in zip(columns, row):
+            c.cell(x, top, x + width, top + row_height, value)
+            x += width
+        top += row_height
+    return c
+
+
+def result_page(layout, prg, sem, batch, inst, scheme_id, subjects, students, rng):
+    c = Canvas()
+    if layout == "newer":
+        header = (
+            f"Programme Code: {prg[0]}      Programme Name: {prg[1]}      "
+            f"Sem./Year/EU: {sem}      Batch: {batch}      "
+            f"Examination: REAPPEAR DEC, 2023    Result Declared Date :08-FEB-24"
+        )
+    else:
+        header = (
+            f"Result of Programme Code: {prg[0]}     Programme Name: {prg[1]}     "
+            f"Sem./Year: {sem}     Batch: {batch}     "
+            f"Examination: RECHECKING REGULAR July, 2023"
+        )
+    c.lines(header, 20, 20)
+    details_width = 120
+    sub_width = 34
+    left = 20
+    right = left + details_width + 2 * sub_width * len(subjects)
+    top = 40
+    row_height = 12
+    c.cell(left, top, left + 40, top + row_height, "Enrollment")
+    c.cell(left + 40, top, left + details_width, top + row_height)
+    c.cell(
+        left + details_width, top, right, top + row_height,
+        f"Institution Code: {inst[0]}  Institution: {inst[1]}",
+    )
+    top += row_height
+    for enrollment, name, sid in students:
+        c.cell(
+            left, top, left + details_width, top + 3 * row_height,
+            f"{enrollment}\n{name}\nSID: {sid}\nSchemeID: {scheme_id}",
+        )
+        x = left + details_width
+        for code, _, _, credits in subjects:
+            internal = rng.randint(10, 25)
+            absent = rng.random() < 0.03
+            external = rng.randint(15, 75)
+            total = internal + (0 if absent else external)
+            c.cell(x, top, x + 2 * sub_width, top + row_height, f"{code}({credits})")
+            c.cell(
+                x, top + row_height, x + sub_width, top + 2 * row_height, str(internal)
+            )
+            c.cell(
+                x + sub_width,
+                top + row_height,
+                x + 2 * sub_width,
+                top + 2 * row_height,
+                "ABS" if absent else str(external),
+            )
+            c.cell(
+                x, top + 2 * row_height, x + 2 * sub_width, top + 3 * row_height,
+                f"{total}({'F' if absent else _grade(total)})",
+            )
+            x += 2 * sub_width
+        top += 3 * row_height
+    return c
+
+
+def build_pages(pages=20, layout="newer", students_per_page=12, seed=0, state=None):
+    """
+    Canvases for a PDF of the given page count, layout is "newer", "older" or
+    "mixed" (the first half newer, the second half older)
+    Enrollments are the institute code plus a per institute serial and schemes are
+    numbered on from the last one, both kept in state, so every (enrollment,
+    schemeID) is generated once, also across the halves of a mixed PDF
+    """
+    state = {"serials": {}, "schemes": 0} if state is None else state
+    if layout == "mixed":
+        return build_pages(
+            pages - pages // 2, "newer", students_per_page, seed, state
+        ) + build_pages(pages // 2, "older", students_per_page, seed + 1, state)
+    rng = random.Random(seed)
+    canvases = []
+    serials = state["serials"]
+    while len(canvases) < pages:
+        sem_index = state["schemes"]
+        state["schemes"] += 1
+        prg = PROGRAMMES[sem_index % len(PROGRAMMES)]
+        sem = SEMESTERS[layout][sem_index % len(SEMESTERS[layout])]
+        scheme_id = f"19{prg[0]}2021{sem_index:03d}"
+        subjects = [
+            (
+                f"ETCS{300 + sem_index * 10 + i}",
+                f"{2021300 + i}",
+                f"PAPER {i}",
+                rng.choice([1, 3, 4]),
+            )
+            for i in range(rng.choice([6, 7, 8]))
+        ]
+        for inst in INSTITUTES:
+            if len(canvases) >= pages:
+                break
+            canvases.append(scheme_page(layout, prg, scheme_id, sem, inst, subjects))
+            for _ in range(3):
+                if len(canvases) >= pages:
+                    break
+                students = []
+                for _ in range(students_per_page):
+                    serials[inst[0]] = serial = serials.get(inst[0], 0) + 1
+                    enrollment = f"{inst[0]}{serial:08d}"
+                    students.append(
+                        (enrollment, f"STUDENT {serial % 9973}", f"1900{enrollment}")
+                    )
+                canvases.append(
+                    result_page(
+                        layout, prg, sem, 2021, inst, scheme_id, subjects, students, rng
+                    )
+                )
+    return canvases
+
+
+def write_pdf(path, canvases):
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>"
+    )
+    kids = []
+    for canvas in canvases:
+        data = canvas.stream()
+        content = add(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data)
+            + data
+            + b"\nendstream"
+        )
+        kids.append(
+            add(
+                (
+                    f"<< /Type /Page /Parent {pages_obj} 0 R "
+                    f"/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                    f"/Resources << /Font << /F1 {font} 0 R >> >> "
+                    f"/Contents {content} 0 R >>"
+                ).encode()
+            )
+        )
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+    objects[pages_obj - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] "
+        f"/Count {len(kids)} >>"
+    ).encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref,
+    )
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthetic GGSIPU result PDF generator"
+    )
+    parser.add_argument("output", help="Path of the PDF to write")
+    parser.add_argument("-n", "--pages", type=int, default=20, help="Page count")
+    parser.add_argument(
+        "-l", "--layout", choices=["newer", "older", "mixed"], default="newer"
+    )
+    parser.add_argument("-s", "--students-per-page", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_pdf(
+        args.output,
+        build_pages(args.pages, args.layout, args.students_per_page, args.seed),
+    )
@@ -0,0 +1,142 @@
+"""
+    Parser-Senpai text backend parity check
+    - Classifies every page and reads its headers on the default pdfplumber text and
+      on a native backend (pdfium), the page types and headers must be identical
+    - Runs on a synthetic PDF (see synthpdf.py) or on a given PDF, exits with 1 on
+      any difference, so it can gate a change to PdfiumText
+
+    Usage:
+        python benchmarks/text_parity.py --pages 200 --layout mixed
+        python benchmarks/text_parity.py --pdf RESULT_BTECH7_DEC2023.pdf
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfplumber
+from rich.console import Console
+from rich.table import Table
+
+import synthpdf
+from ParserSenpai import (
+    TEXT_BACKENDS,
+    PageContext,
+    PageIndex,
+    PageType,
+    PTResult,
+    PTScheme,
+    enumPageType,
+    open_text_backend,
+)
+
+console = Console()
+
+
+def describe(ctx):
+    # Page type and every header the parser reads from the page text
+    ptype = PageType(ctx).ptype
+    headers = {"index": PageIndex.describe(ctx)}
+    if ptype == enumPageType.SCHEME:
+        headers["scheme"] = PTScheme(ctx).get_scheme_header()
+    elif ptype == enumPageType.RESULT:
+        headers["result"] = PTResult(ctx).get_result_header()
+    return str(ptype), headers
+
+
+def read_pages(pdf_path, text_backend):
+    # (page type, headers) of every page, and the seconds spent on them
+    pages = []
+    seconds = 0.0
+    with pdfplumber.open(pdf_path) as pdf:
+        text = open_text_backend(pdf_path, text_backend)
+        try:
+            for page in pdf.pages:
+                start = perf_counter()
+                ctx = PageContext(page, text_backend=text)
+                pages.append(describe(ctx))
+                seconds += perf_counter() - start
+                ctx.flush()
+        finally:
+            if text is not None:
+                text.close()
+    return pages, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser-Senpai text backend parity")
+    parser.add_argument("--pdf", help="Check this PDF instead of a synthetic one")
+    parser.add_argument("-n", "--pages", type=int, default=100)
+    parser.add_argument(
+        "-l", "--layout", choices=["newer", "older", "mixed"], default="mixed"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-tb",
+        "--text-backend",
+        choices=[
+            name for name, backend in TEXT_BACKENDS.items() if backend is not None
+        ],
+        default="pdfium",
+        help="Backend to check against pdfplumber",
+    )
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    tmp = None
+    if pdf_path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp.close()
+        pdf_path = tmp.name
+        synthpdf.write_pdf(
+            pdf_path, synthpdf.build_pages(args.pages, args.layout, seed=args.seed)
+        )
+
+    try:
+        expected, expected_seconds = read_pages(pdf_path, "pdfplumber")
+        actual, actual_seconds = read_pages(pdf_path, args.text_backend)
+    finally:
+        if tmp is not None:
+            os.remove(pdf_path)
+
+    differences = [
+        (page_number, want, got)
+        for page_number, (want, got) in enumerate(zip(expected, actual), start=1)
+        if want != got
+    ]
+    for page_number, want, got in differences[:10]:
+        console.print(f"[bold red]Page {page_number}[/]")
+        console.print("pdfplumber:", want)
+        console.print(f"{args.text_backend}:", got)
+
+    table = Table(title="Text backend parity")
+    table.add_column("Backend")
+    table.add_column("Pages", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Pages/sec", justify="right")
+    for name, seconds in (
+        ("pdfplumber", expected_seconds),
+        (args.text_backend, actual_seconds),
+    ):
+        table.add_row(
+            name,
+            str(len(expected)),
+            f"{seconds:.3f}",
+            f"{len(expected) / seconds:.1f}" if seconds else "-",
+        )
+    console.print(table)
+
+    if differences:
+        console.print(
+            f"[bold red]{len(differences)}[/] of {len(expected)} pages differ"
+        )
+        sys.exit(1)
+    console.print(f"All [bold blue]{len(expected)}[/] pages identical")
+
+
+if __name__ == "__main__":
+    main()